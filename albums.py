@@ -0,0 +1,51 @@
+import asyncio
+
+
+# === Сборка альбомов
+# Каждая часть альбома приходит отдельным событием. Части копятся по (chat_id, grouped_id),
+# пока debounce секунд не приходит новых (или не набралось max_parts), после чего
+# emit получает их все разом — один альбом, одна классификация, одна доставка.
+class AlbumBuffer:
+    def __init__(self, debounce=1.5, max_parts=10):
+        self.debounce = debounce
+        self.max_parts = max_parts
+        self._groups = {}
+        self._tasks = set()
+
+    def add(self, key, item, emit):
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {'items': [], 'emit': emit, 'timer': None}
+        else:
+            group['timer'].cancel()
+        group['items'].append(item)
+
+        if len(group['items']) >= self.max_parts:
+            self._flush(key)
+        else:
+            group['timer'] = asyncio.get_running_loop().call_later(self.debounce, self._flush, key)
+
+    def _flush(self, key):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        if group['timer'] is not None:
+            group['timer'].cancel()
+        task = asyncio.ensure_future(group['emit'](group['items']))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[!] Ошибка обработки альбома: {task.exception()}")
+
+    def pending(self):
+        return len(self._groups)
+
+    # Выпустить всё накопленное и дождаться обработки (остановка, бенчмарки)
+    async def drain(self):
+        for key in list(self._groups):
+            self._flush(key)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,445 @@
+import argparse
+import asyncio
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from recorder import load_recording
+from send_scheduler import TokenBucket
+
+# --- НАСТРОЙКИ ---
+POSTS = 300                  # Сколько постов прогнать
+CHANNELS = 12                # Сколько каналов-источников
+ARRIVAL_RATE = 50            # Постов в секунду на входе (0 — всё разом)
+SEND_LATENCY = 0.05          # Задержка фейкового Telegram на один вызов
+REAL_SEND_LIMITS = False     # True — лимиты отправки как в bot.py (прогон растянется на минуты)
+REPLAY_FILE = None           # Запись событий (bot.py RECORD_EVENTS) вместо синтетики
+REPLAY_SPEED = 1.0           # Темп воспроизведения: 1 — как в записи, N — в N раз быстрее, 0 — без пауз
+PROVIDERS = [
+    # имя, средняя задержка (с), доля ошибок, распределение ответов
+    ("FakeFast", 1.0, 0.05, {"полезно": 0.5, "бесполезно": 0.3, "реклама": 0.2}),
+    ("FakeMedium", 3.0, 0.10, {"полезно": 0.5, "бесполезно": 0.3, "реклама": 0.2}),
+    ("FakeSlow", 8.0, 0.20, {"полезно": 0.4, "бесполезно": 0.4, "реклама": 0.2}),
+    ("FakeFlaky", 2.0, 0.50, {"полезно": 0.5, "бесполезно": 0.3, "реклама": 0.2}),
+]
+MIX = {                      # Доли типов постов
+    "plain": 0.45,
+    "album": 0.15,
+    "copy": 0.15,
+    "long": 0.10,
+    "filtered": 0.10,
+    "repost": 0.05,
+}
+OUTPUT_FILE = "bench_output.txt"
+# --- КОНЕЦ НАСТРОЕК ---
+
+FILTER_WORDS = ["казино", "ставка", "букмекер"]
+VOCABULARY = (
+    "арбитраж трафик связка оффер кейс профит настройка крео лендинг пиксель фейсбук гугл тикток "
+    "бан аккаунт прокси антидетект скрипт парсер автоматизация бюджет конверсия лид апрув выплата "
+    "партнёрка платёжка карта трекер домен клоака модерация ретаргет аудитория гео тест масштаб "
+    "ctr cpm roi epc вебинар розыгрыш приз конференция митап курс наставник подкаст интервью"
+).split()
+
+
+# === Фейковый Telegram: считает вызовы и изображает сетевую задержку
+class FakeEntity:
+    def __init__(self, entity_id, username=None, title=None):
+        self.id = entity_id
+        self.username = username
+        self.title = title or f"channel {entity_id}"
+        self.broadcast = True
+
+
+class FakePeer:
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+
+
+class FakeForward:
+    def __init__(self, channel_id):
+        self.from_id = FakePeer(channel_id)
+
+
+class FakePhoto:
+    def __init__(self, photo_id):
+        self.id = photo_id
+
+
+class FakeDocument:
+    def __init__(self, document_id, mime_type=None):
+        self.id = document_id
+        self.mime_type = mime_type
+
+
+class FakeMedia:
+    def __init__(self, photo_id=None, document=None):
+        self.photo = FakePhoto(photo_id) if photo_id is not None else None
+        self.document = document
+
+
+class FakeMessage:
+    def __init__(self, chat, message_id, text, grouped_id=None, media=None, fwd_from=None):
+        self.chat = chat
+        self.id = message_id
+        self.text = text
+        self.grouped_id = grouped_id
+        self.media = media
+        self.fwd_from = fwd_from
+        self.poll = None
+        self.voice = None
+        self.video_note = None
+
+    async def get_chat(self):
+        return self.chat
+
+
+class FakeEvent:
+    def __init__(self, message, chat_id=None, is_channel=True):
+        self.message = message
+        self.chat = message.chat
+        self.chat_id = chat_id if chat_id is not None else message.chat.id
+        self.is_channel = is_channel
+        self.poll = message.poll
+        self.voice = message.voice
+        self.video_note = message.video_note
+
+
+class FakeClient:
+    def __init__(self, latency=SEND_LATENCY):
+        self.latency = latency
+        self.calls = Counter()
+        self.history = {}
+
+    async def _call(self, name):
+        self.calls[name] += 1
+        await asyncio.sleep(self.latency)
+
+    async def send_message(self, entity, message, **kwargs):
+        await self._call('send_message')
+
+    async def send_file(self, entity, file=None, caption=None, **kwargs):
+        await self._call('send_file')
+
+    async def forward_messages(self, entity, messages=None, from_peer=None, **kwargs):
+        await self._call('forward_messages')
+
+    async def get_entity(self, entity):
+        await self._call('get_entity')
+        return FakeEntity(entity if isinstance(entity, int) else getattr(entity, 'channel_id', 0))
+
+    async def get_messages(self, chat_id, ids=None):
+        await self._call('get_messages')
+        history = self.history.get(chat_id, {})
+        return [history.get(i) for i in ids]
+
+    async def iter_messages(self, chat_id, min_id=0, max_id=None, reverse=False, limit=None, **kwargs):
+        await self._call('iter_messages')
+        history = self.history.get(getattr(chat_id, 'id', chat_id), {})
+        ids = sorted((i for i in history if i > min_id and (max_id is None or i < max_id)), reverse=not reverse)
+        for i in ids[:limit]:
+            yield history[i]
+
+
+# === Фейковые провайдеры: задержка, доля ошибок и распределение ответов
+def make_providers():
+    providers = {}
+    for name, latency, error_rate, answers in PROVIDERS:
+        cls = type(name, (), {"models": ["fake-model"]})
+        providers[cls] = (latency, error_rate, answers)
+    return providers
+
+
+def fake_completion_factory(providers, rng):
+    async def fake_completion(provider, model, prompt, timeout=30):
+        latency, error_rate, answers = providers[provider]
+        delay = min(rng.lognormvariate(0, 0.5) * latency, timeout + 1)
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(delay)
+        if rng.random() < error_rate:
+            raise RuntimeError("fake provider error")
+        batch = re.search(r"Analyze each of these (\d+) numbered posts", prompt)
+        if batch:
+            words = rng.choices(list(answers), weights=list(answers.values()), k=int(batch.group(1)))
+            return "\n".join(f"{i + 1}: {word}" for i, word in enumerate(words))
+        return rng.choices(list(answers), weights=list(answers.values()))[0]
+    return fake_completion
+
+
+# === Генерация событий
+def random_text(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def make_events(rng, copy_channels, client):
+    channels = [FakeEntity(-1000000000000 - i, title=f"source {i}") for i in range(CHANNELS)]
+    next_id = Counter()
+    grouped = 0
+    sent_texts = []
+    events = []
+
+    def new_message(chat, text, **kwargs):
+        next_id[chat.id] += 1
+        msg = FakeMessage(chat, next_id[chat.id], text, **kwargs)
+        client.history.setdefault(chat.id, {})[msg.id] = msg
+        return msg
+
+    kinds = rng.choices(list(MIX), weights=list(MIX.values()), k=POSTS)
+    for kind in kinds:
+        chat = rng.choice(channels)
+        if kind == "repost" and sent_texts:
+            text = rng.choice(sent_texts)
+        elif kind == "long":
+            text = random_text(rng, 450)
+        elif kind == "filtered":
+            text = random_text(rng, 40) + " " + rng.choice(FILTER_WORDS)
+        else:
+            text = random_text(rng, rng.randint(20, 120))
+        sent_texts.append(text)
+
+        if kind == "album":
+            grouped += 1
+            parts = rng.randint(2, 10)
+            group = []
+            for part in range(parts):
+                media = FakeMedia(rng.getrandbits(48))
+                group.append(FakeEvent(new_message(chat, text if part == 0 else "", grouped_id=grouped, media=media)))
+            events.append((kind, group))
+        elif kind == "copy":
+            source = rng.choice(list(copy_channels))
+            events.append((kind, [FakeEvent(new_message(chat, text, fwd_from=FakeForward(source)))]))
+        else:
+            media = FakeMedia(rng.getrandbits(48)) if rng.random() < 0.3 else None
+            events.append((kind, [FakeEvent(new_message(chat, text, media=media))]))
+    return events
+
+
+# === Воспроизведение записи: [(t, вид, событие)] с моментами прихода из файла
+def replay_media(descriptor):
+    if descriptor is None:
+        return None
+    if descriptor['type'] == 'photo':
+        return FakeMedia(descriptor['id'])
+    if descriptor['type'] == 'document':
+        return FakeMedia(document=FakeDocument(descriptor['id'], descriptor.get('mime')))
+    return type(descriptor['type'], (), {})()
+
+
+def make_replay_events(records, copy_channels, client):
+    chats = {}
+    events = []
+    for rec in records:
+        chat = None
+        if rec['chat'] is not None:
+            chat = chats.get(rec['chat_id'])
+            if chat is None:
+                info = rec['chat']
+                chat = chats[rec['chat_id']] = FakeEntity(info['id'], username=info['username'], title=info['title'])
+                chat.broadcast = info['broadcast']
+
+        fwd_from = FakeForward(rec['fwd_channel_id']) if rec['fwd_channel_id'] else None
+        msg = FakeMessage(chat, rec['id'], rec['text'], grouped_id=rec['grouped_id'],
+                          media=replay_media(rec['media']), fwd_from=fwd_from)
+        msg.poll = True if rec['poll'] else None
+        msg.voice = True if rec['voice'] else None
+        msg.video_note = True if rec['video_note'] else None
+        client.history.setdefault(rec['chat_id'], {})[msg.id] = msg
+
+        if rec['grouped_id']:
+            kind = "album"
+        elif rec['fwd_channel_id'] in copy_channels:
+            kind = "copy"
+        else:
+            kind = "plain"
+        events.append((rec['t'], kind, FakeEvent(msg, chat_id=rec['chat_id'], is_channel=rec['is_channel'])))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+# === Прогон
+async def run_bench(bot, seed):
+    rng = random.Random(seed)
+    providers = make_providers()
+    bot.request_completion = fake_completion_factory(providers, rng)
+    bot.fallback_providers[:] = list(providers)
+    bot.provider_registry.providers = list(providers)
+
+    if not REAL_SEND_LIMITS:
+        bot.sender.bucket = TokenBucket(1000, 1000)
+        bot.sender.destination_rate = bot.sender.destination_burst = 1000
+
+    client = FakeClient()
+    if REPLAY_FILE:
+        replay = make_replay_events(load_recording(REPLAY_FILE), bot.COPY_CHANNELS, client)
+    else:
+        events = make_events(rng, bot.COPY_CHANNELS, client)
+
+    arrivals = {}
+    latencies = []
+    verdicts = Counter()
+    classify = bot.classify_job
+
+    async def timed_classify(job, client):
+        passed = await classify(job, client)
+        key = (job.chat_id, job.message.id)
+        if key in arrivals:
+            latencies.append(time.monotonic() - arrivals[key])
+        verdicts[job.result if passed else "отсеяно"] += 1
+        return passed
+
+    bot.classify_job = timed_classify
+    try:
+        pipeline = bot.build_pipeline(client)
+        pipeline.start()
+        store_task = asyncio.create_task(bot.store.run())
+        sender_task = asyncio.create_task(bot.sender.run())
+        diagnostics_task = asyncio.create_task(bot.diagnostics.run(lambda text: bot.send_diagnostics(client, text)))
+
+        async def feed(event, key):
+            arrivals.setdefault(key, time.monotonic())
+            job = bot.accept_event(event)
+            if job is not None:
+                await bot.submit_job(job, pipeline.submit)
+
+        started = time.monotonic()
+        if REPLAY_FILE:
+            # части альбома считаем одним постом, латентность — от прихода первой части
+            album_keys = {}
+            for _, _, event in replay:
+                if event.message.grouped_id:
+                    group_key = (event.chat_id, event.message.grouped_id)
+                    album_keys[group_key] = min(album_keys.get(group_key, event.message.id), event.message.id)
+            seen = set()
+            events = []
+            for t, kind, event in replay:
+                if REPLAY_SPEED:
+                    delay = started + t / REPLAY_SPEED - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                msg = event.message
+                if msg.grouped_id:
+                    group_key = (event.chat_id, msg.grouped_id)
+                    if group_key not in seen:
+                        seen.add(group_key)
+                        events.append((kind, [event]))
+                    key = (event.chat_id, album_keys[group_key])
+                else:
+                    key = (event.chat_id, msg.id)
+                    events.append((kind, [event]))
+                await feed(event, key)
+        else:
+            for kind, group in events:
+                for event in group:
+                    await feed(event, (event.chat_id, group[0].message.id))
+                if ARRIVAL_RATE:
+                    await asyncio.sleep(rng.expovariate(ARRIVAL_RATE))
+
+        await bot.album_buffer.drain()
+        await pipeline.intake.join()
+        await pipeline.outbox.join()
+        elapsed = time.monotonic() - started
+
+        diagnostics_task.cancel()
+        await asyncio.gather(diagnostics_task, return_exceptions=True)
+        await bot.diagnostics.flush(lambda text: bot.send_diagnostics(client, text))
+        await pipeline.stop()
+        sender_task.cancel()
+        store_task.cancel()
+    finally:
+        bot.classify_job = classify
+
+    posts = len(events)
+    outbound = sum(client.calls.values())
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    lines = [
+        f"Постов: {posts} ({', '.join(f'{k}={v}' for k, v in Counter(k for k, _ in events).items())})",
+        f"Время: {elapsed:.2f}s | Пропускная способность: {posts / elapsed:.1f} постов/с",
+        f"Латентность вердикта: p50 {percentile(latencies, 50):.2f}s | p95 {percentile(latencies, 95):.2f}s | p99 {percentile(latencies, 99):.2f}s",
+        f"Вердикты: {dict(verdicts)}",
+        f"Вызовов Telegram API: {outbound} ({outbound / posts:.2f} на пост) {dict(client.calls)}",
+        f"Кэш лемм: {bot.lemma_cache_stats()} | Кэш вердиктов: {bot.verdict_cache.stats()}",
+        f"Отложено в повторы: {len(bot.retry_scheduler.entries)}",
+        f"Отправки: {bot.sender.stats()}",
+        f"Предклассификатор: {bot.classifier.stats()}",
+        f"Пакеты LLM: {bot.gpt_batcher.stats()} | Склейка одинаковых: {bot.gpt_flights.stats()}",
+        "Стадии (avg/n): " + ", ".join(
+            f"{dict(labels)['stage']} {hist.sum / hist.count * 1000:.2f}ms/{hist.count}"
+            for (name, labels), hist in sorted(bot.metrics.histograms.items()) if name == 'stage_seconds'
+        ),
+        f"Пиковый RSS: {peak_rss_mb:.1f} MB",
+    ]
+    return lines
+
+
+def main():
+    global POSTS, CHANNELS, ARRIVAL_RATE, SEND_LATENCY, REAL_SEND_LIMITS, REPLAY_FILE, REPLAY_SPEED
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк bot.py на фейковом Telegram и фейковых провайдерах")
+    parser.add_argument("--posts", type=int, default=POSTS)
+    parser.add_argument("--channels", type=int, default=CHANNELS)
+    parser.add_argument("--rate", type=float, default=ARRIVAL_RATE, help="постов/с, 0 — всё разом")
+    parser.add_argument("--send-latency", type=float, default=SEND_LATENCY)
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--real-send-limits", action="store_true", default=REAL_SEND_LIMITS,
+                        help="не снимать лимиты отправки bot.py")
+    parser.add_argument("--replay", default=REPLAY_FILE, help="JSONL-запись событий из bot.py (RECORD_EVENTS)")
+    parser.add_argument("--speed", default=str(REPLAY_SPEED), help="темп воспроизведения: 1, N или max")
+    args = parser.parse_args()
+    POSTS, CHANNELS, ARRIVAL_RATE, SEND_LATENCY = args.posts, args.channels, args.rate, args.send_latency
+    REAL_SEND_LIMITS = args.real_send_limits
+    REPLAY_FILE = os.path.abspath(args.replay) if args.replay else None
+    REPLAY_SPEED = 0.0 if args.speed == "max" else float(args.speed)
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    output = os.path.abspath(args.output)
+
+    # Всё состояние бота (bot.db, кэши, last_id.txt) — во временной папке, боевое не трогаем
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        with open(os.path.join(workdir, "filter_words.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(FILTER_WORDS) + "\n")
+        os.chdir(workdir)
+        sys.path.insert(0, repo_dir)
+        os.environ.setdefault("API_ID", "0")
+        os.environ.setdefault("API_HASH", "bench")
+
+        import bot
+        bot.filter_index.refresh(force=True)
+        bot.diagnostics.interval = 5
+
+        lines = asyncio.run(run_bench(bot, args.seed))
+        bot.store.close()
+    finally:
+        os.chdir(repo_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n" + "=" * 50)
+    for line in lines:
+        print(line)
+    print("=" * 50)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"Результат сохранен в: {output}")
+
+
+if __name__ == "__main__":
+    main()
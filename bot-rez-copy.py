@@ -1,5 +1,5 @@
 import asyncio
-import osMore actions
+import os
 import re
 import pymorphy2
 import g4f
@@ -8,11 +8,25 @@ from telethon.tl.types import Message, PeerChannel, PeerUser
 
 
 from config import API_ID, API_HASH, SESSION_NAME
+from storage import Store
+from entity_cache import EntityCache
 
 # === Каналы
 CHANNEL_GOOD = 'https://t.me/fbeed1337'
 CHANNEL_TRASH = 'https://t.me/musoradsxx'
 
+# === Кэш каналов для строки "Источник:" (get_entity только при первой встрече канала)
+store = Store('bot-rez-copy.db')
+entity_cache = EntityCache(store, ttl=24 * 3600, negative_ttl=6 * 3600)
+ENTITY_REFRESH_INTERVAL = 600
+
+def format_source(entry, channel_id):
+    if entry is None:
+        return f"Источник: канал {channel_id}"
+    if entry["username"]:
+        return f"Источник: https://t.me/{entry['username']}"
+    return f"Источник: {entry['title']} {entry['id']}"
+
 # === Провайдеры
 fallback_providers = [
     # === g4f.Provider.AnyProvider,
@@ -155,19 +169,14 @@ async def handle_message(event, client):
 
 
 
-    source = ""
     if event.message.fwd_from and getattr(event.message.fwd_from.from_id, 'channel_id', None):
-        try:
-            entity = await client.get_entity(PeerChannel(event.message.fwd_from.from_id.channel_id))
-            source = f"Источник: https://t.me/{entity.username}" if entity.username else f"Источник: {entity.title} {entity.id}"
-        except:
-            source = f"Источник: канал {event.message.fwd_from.from_id.channel_id}"
+        channel_id = event.message.fwd_from.from_id.channel_id
+        entry = await entity_cache.lookup(client, channel_id)
     else:
-        try:
-            entity = await client.get_entity(event.chat_id)
-            source = f"Источник: https://t.me/{entity.username}" if entity.username else f"Источник: {entity.title} {entity.id}"
-        except:
-            source = f"Источник: канал {event.chat_id}"
+        # канал, где вышел пост, приходит вместе с событием — в сеть не ходим
+        channel_id = event.message.to_id.channel_id
+        entry = entity_cache.remember(event.chat) if event.chat else await entity_cache.lookup(client, channel_id)
+    source = format_source(entry, channel_id)
 
     target_channel = CHANNEL_GOOD if result == "полезно" else CHANNEL_TRASH
 
@@ -237,14 +246,14 @@ async def main():
     async def handler(event):
         await handle_message(event, client)
 
-
-
-
-
-
-
-
-    await client.run_until_disconnected()
+    store_task = asyncio.create_task(store.run())
+    refresh_task = asyncio.create_task(entity_cache.refresh_loop(client, interval=ENTITY_REFRESH_INTERVAL))
+    try:
+        await client.run_until_disconnected()
+    finally:
+        refresh_task.cancel()
+        store_task.cancel()
+        store.close()
 
 
 if __name__ == "__main__":
@@ -1,23 +1,61 @@
 import asyncio
-import os
+import functools
 import re
+import time
 import pymorphy3
 import g4f
 from telethon import TelegramClient, events
 from telethon.tl.types import Message
 from config import API_ID, API_HASH, SESSION_NAME
+from filter_index import FilterIndex
+from verdict_cache import VerdictCache, content_fingerprint
+from near_dup import NearDuplicateIndex
+from pipeline import Job, Pipeline
+from retry_scheduler import RetryScheduler
+from voting import VERDICTS, decide, run_batch_vote, run_vote
+from providers import ProviderRegistry
+from diagnostics import DiagnosticsSink
+from llm import SyncPoolBusy, probe_pool, request_completion
+from albums import AlbumBuffer
+from checkpoints import CheckpointStore
+from storage import Store
+from recorder import EventRecorder
+from metrics import Metrics
+from prober import ProviderProber
+from classifier import NaiveBayesClassifier
+from batching import MicroBatcher
+from singleflight import SingleFlight
+from entity_cache import EntityCache
+from send_scheduler import SendScheduler, PRIORITY_DIAGNOSTICS
 
 # === Каналы
 CHANNEL_GOOD = 'https://t.me/fbeed1337'
 CHANNEL_TRASH = 'https://t.me/musoradsxx'
 
-# === Источники с копированием (channel_id: ссылка)
+# === Источники с копированием (channel_id: ссылка; None — ссылка из кэша каналов)
 COPY_CHANNELS = {
     1672980976: "https://t.me/piratecpa",
     2530485449: "https://t.me/huihuihui111111111111",
     2101853050: "https://t.me/sapogcpa"
 }
 
+# === Отправка: общий лимит и лимит на каждый канал назначения (сообщений в секунду)
+SEND_RATE = 1.0
+SEND_BURST = 5
+DESTINATION_RATE = 20 / 60
+DESTINATION_BURST = 3
+SEND_CONCURRENCY = 2
+SEND_MAX_ATTEMPTS = 5
+
+sender = SendScheduler(
+    rate=SEND_RATE, burst=SEND_BURST,
+    destination_rate=DESTINATION_RATE, destination_burst=DESTINATION_BURST,
+    concurrency=SEND_CONCURRENCY, max_attempts=SEND_MAX_ATTEMPTS
+)
+
+# === Хранилище (SQLite, WAL): посты, вердикты, ответы провайдеров, доставки и состояние
+store = Store('bot.db')
+
 # === Провайдеры
 fallback_providers = [
     g4f.Provider.CohereForAI_C4AI_Command,
@@ -26,157 +64,565 @@ fallback_providers = [
     g4f.Provider.Yqcloud
 ]
 
+# Сначала спрашиваем TOP_K лучших по статистике, остальные — только вдогонку (хедж)
+TOP_K = 3
+HEDGE_DELAY = 8
+
+provider_registry = ProviderRegistry(fallback_providers, store)
+
+# Фоновый пробник: fallback_providers — только стартовый пул, дальше его ведёт пробник.
+# Синхронных провайдеров проверяет в своём пуле потоков (llm.probe_pool), живые посты его не ждут.
+PROBE_INTERVAL = 120
+PROBE_CONCURRENCY = 5
+PROBE_MAX_POOL = 8
+
+provider_prober = ProviderProber(
+    provider_registry, store, fallback_providers, functools.partial(request_completion, pool=probe_pool),
+    interval=PROBE_INTERVAL, concurrency=PROBE_CONCURRENCY,
+    min_pool=TOP_K, max_pool=PROBE_MAX_POOL
+)
+
+# === Диагностика в CHANNEL_TRASH: дайджест раз в минуту ('channel') или только лог ('log')
+DIAGNOSTICS_MODE = 'channel'
+DIAGNOSTICS_INTERVAL = 60
+
+diagnostics = DiagnosticsSink(mode=DIAGNOSTICS_MODE, interval=DIAGNOSTICS_INTERVAL)
+
+# === Метрики: задержки стадий и счётчики в формате Prometheus
+# METRICS_PORT — http://127.0.0.1:PORT/metrics (None — не поднимать), METRICS_FILE — периодический дамп
+METRICS_PORT = 9108
+METRICS_FILE = None
+METRICS_DUMP_INTERVAL = 60
+
+metrics = Metrics()
+
 # === Очистка текста
+URL_RE = re.compile(r'https?://\S+')
+TOKEN_RE = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+
 def sanitize_input(text):
-    text = re.sub(r'https?://\S+', '[ссылка]', text)
+    text = URL_RE.sub('[ссылка]', text)
     text = re.sub(r'[^\wа-яА-ЯёЁ.,:;!?%()\-–—\n ]+', '', text)
     return text.strip()[:2000]
 
 # === Лемматизация (pymorphy3)
-filter_words = set()
+LEMMA_CACHE_SIZE = 50000
+
 morph = pymorphy3.MorphAnalyzer(lang='ru')
 
+# Общий LRU-кэш для текста постов и стоп-слов: лексика в каналах повторяется
+@functools.lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word):
+    return morph.parse(word)[0].normal_form
+
+def lemma_cache_stats():
+    info = lemmatize.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "hit_rate": info.hits / total if total else 0.0,
+    }
+
+filter_index = FilterIndex('filter_words.txt', lemmatize)
+
 def load_filter_words():
-    global filter_words
-    if os.path.exists('filter_words.txt'):
-        with open('filter_words.txt', 'r', encoding='utf-8') as f:
-            filter_words.clear()
-            for line in f:
-                word = line.strip().lower()
-                if word:
-                    lemma = morph.parse(word)[0].normal_form
-                    filter_words.add(lemma)
-
-def normalize_text(text):
-    words = text.lower().split()
-    return {morph.parse(word)[0].normal_form for word in words}
-
-# === Проверка GPT
-async def check_with_gpt(text: str, client) -> str:
-    clean_text = sanitize_input(text.replace('"', "'").replace("\n", " "))
+    filter_index.refresh()
 
-    prompt = (
-        "Role: Strict Filter for a CPA Affiliate Marketing Channel.\n"
-        "Goal: Classify text into exactly one category based on value.\n\n"
+# Ссылки выкидываем так же, как в sanitize_input, пунктуация к словам не липнет
+def tokenize(text):
+    return TOKEN_RE.findall(URL_RE.sub(' ', text.lower()))
 
-        "🟢 CATEGORY 'полезно' (KEEP IF):\n"
-        "- Hard Skills: Case studies (ROI/Profit), schemes, settings, offer comparisons.\n"
-        "- Tech: Scripts, API, parsers, automation, anti-detect setups.\n"
-        "- TOOLS & AI: Reviews of ANY software/AI (e.g., converters, design tools, ChatGPT, MidJourney, Sora). NOTE: Describing a tool's function is USEFUL, NOT an ad.\n"
-        "- Critical News: Platform updates (FB/Google/TT), bans, payment solutions.\n\n"
+def lemma_sequence(text):
+    return [lemmatize(word) for word in tokenize(text)]
 
-        "🔴 CATEGORY 'бесполезно' (TRASH IF):\n"
-        "- Lifestyle: Motivation, philosophy, personal thoughts, weather, 'life lessons'.\n"
-        "- Formats: Interviews, podcasts, video-talks, giveaways, contests, prizes.\n"
-        "- Events: Parties, conferences, meetups, gatherings.\n"
-        "- Fluff: Market history, complaints, 'content evolution', longreads without specific numbers/tools.\n\n"
+# === Кэш вердиктов (повторы одного и того же поста не ходят в GPT)
+AUTOSAVE_INTERVAL = 60
 
-        "🚫 CATEGORY 'реклама' (TRASH IF):\n"
-        "- Direct selling of courses/mentorship or non-targeted offers without educational value.\n\n"
+verdict_cache = VerdictCache(store)
 
+def media_signature(message):
+    media = message.media
+    if media is None:
+        return None
+    photo = getattr(media, 'photo', None)
+    if photo is not None:
+        return f"photo:{photo.id}"
+    document = getattr(media, 'document', None)
+    if document is not None:
+        return f"doc:{document.id}"
+    return type(media).__name__
+
+# === Почти-дубликаты: 'drop' — не пересылать повторно, 'reuse' — взять прошлый вердикт
+NEAR_DUP_ACTION = 'drop'
+
+near_dup_index = NearDuplicateIndex(threshold=0.8, window=72 * 3600, max_entries=50000)
+
+# === Локальный предклассификатор: учится на вердиктах GPT, уверенные посты решает сам
+CLASSIFIER_THRESHOLD = 0.97   # ниже — спрашиваем GPT
+CLASSIFIER_MIN_DOCS = 200     # до стольких примеров каждого класса только учится
+CLASSIFIER_AUDIT = 0.05       # доля уверенных постов, которые всё равно идут в GPT для сверки
+
+classifier = NaiveBayesClassifier(
+    store, threshold=CLASSIFIER_THRESHOLD, min_docs=CLASSIFIER_MIN_DOCS, audit=CLASSIFIER_AUDIT
+)
+
+# === Кэш каналов: id, username, title всех каналов, откуда приходили посты
+entity_cache = EntityCache(store)
+ENTITY_REFRESH_INTERVAL = 600
+
+def channel_label(chat_id):
+    entry = entity_cache.get(bare_channel_id(chat_id))
+    if entry is None:
+        return str(chat_id)
+    return f"@{entry['username']}" if entry['username'] else (entry['title'] or str(chat_id))
+
+# В сеть — только при первой встрече канала, дальше из кэша (его обновляет refresh_loop)
+async def copy_source(client, channel_id):
+    source_url = COPY_CHANNELS.get(channel_id)
+    if source_url:
+        return source_url
+    entry = await entity_cache.lookup(client, channel_id)
+    if entry is not None and entry['username']:
+        return f"https://t.me/{entry['username']}"
+    if entry is not None and entry['title']:
+        return entry['title']
+    return f"канал {channel_id}"
+
+# === Отложенные посты (когда ни один провайдер не ответил)
+retry_scheduler = RetryScheduler(store, base_delay=60, max_delay=1800, max_attempts=12)
+
+async def autosave_loop():
+    while True:
+        await asyncio.sleep(AUTOSAVE_INTERVAL)
+        provider_registry.save()
+        checkpoints.flush()
+
+# === Проверка GPT (None — ни один провайдер не ответил)
+PROMPT_RULES = (
+    "Role: Strict Filter for a CPA Affiliate Marketing Channel.\n"
+    "Goal: Classify text into exactly one category based on value.\n\n"
+
+    "🟢 CATEGORY 'полезно' (KEEP IF):\n"
+    "- Hard Skills: Case studies (ROI/Profit), schemes, settings, offer comparisons.\n"
+    "- Tech: Scripts, API, parsers, automation, anti-detect setups.\n"
+    "- TOOLS & AI: Reviews of ANY software/AI (e.g., converters, design tools, ChatGPT, MidJourney, Sora). NOTE: Describing a tool's function is USEFUL, NOT an ad.\n"
+    "- Critical News: Platform updates (FB/Google/TT), bans, payment solutions.\n\n"
+
+    "🔴 CATEGORY 'бесполезно' (TRASH IF):\n"
+    "- Lifestyle: Motivation, philosophy, personal thoughts, weather, 'life lessons'.\n"
+    "- Formats: Interviews, podcasts, video-talks, giveaways, contests, prizes.\n"
+    "- Events: Parties, conferences, meetups, gatherings.\n"
+    "- Fluff: Market history, complaints, 'content evolution', longreads without specific numbers/tools.\n\n"
+
+    "🚫 CATEGORY 'реклама' (TRASH IF):\n"
+    "- Direct selling of courses/mentorship or non-targeted offers without educational value.\n\n"
+)
+
+def clean_for_prompt(text):
+    return sanitize_input(text.replace('"', "'").replace("\n", " "))
+
+def parse_verdict(response):
+    return re.sub(r'[^а-яА-Я]', '', (response or "").strip().lower())
+
+def provider_model(provider):
+    models = getattr(provider, "models", [])
+    return models[0] if models else "gpt-3.5-turbo"
+
+# results: [(fingerprint, ответ)] — по строке на пост, в пакетном запросе их несколько
+def record_provider_call(provider, model, latency, outcome, results):
+    provider_registry.record(provider.__name__, latency, outcome)
+    metrics.observe('llm_call_seconds', latency, provider=provider.__name__)
+    metrics.inc('llm_calls_total', provider=provider.__name__, outcome=outcome)
+    for fingerprint, answer in results:
+        store.insert(
+            'provider_results', ts=time.time(), content_hash=fingerprint, provider=provider.__name__,
+            model=model, outcome=outcome, answer=answer, latency=latency
+        )
+
+async def check_with_gpt(text: str, client, fingerprint=None):
+    clean_text = clean_for_prompt(text)
+
+    prompt = (
+        PROMPT_RULES +
         f"Analyze this text:\n\"\"\"{clean_text}\"\"\"\n\n"
         "Output ONLY one Russian word: 'полезно', 'бесполезно', or 'реклама'."
     )
 
-    total = len(fallback_providers)
+    ranked = provider_registry.ranked(TOP_K)
+    total = len(ranked)
+
+    def record(provider, model, started, outcome, answer=None):
+        record_provider_call(provider, model, time.monotonic() - started, outcome, [(fingerprint, answer)])
 
     async def call_provider(provider, index):
+        started = time.monotonic()
+        model = None
         try:
-            models = getattr(provider, "models", [])
-            model = models[0] if models else "gpt-3.5-turbo"
-
-            response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    g4f.ChatCompletion.create,
-                    provider=provider,
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}]
-                ),
-                timeout=30
-            )
-            result = (response or "").strip().lower()
-            result = re.sub(r'[^а-яА-Я]', '', result)
+            model = provider_model(provider)
+
+            response = await request_completion(provider, model, prompt, timeout=30)
+            result = parse_verdict(response)
 
             if not result:
-                await client.send_message(CHANNEL_TRASH, f"{index+1}/{total} ⚠️ {provider.__name__} пустой ответ")
+                record(provider, model, started, 'invalid')
+                diagnostics.report(f"{index+1}/{total} ⚠️ {provider.__name__} пустой ответ")
                 return None
 
             if result in ['реклама', 'бесполезно', 'полезно']:
-                await client.send_message(CHANNEL_TRASH, f"{index+1}/{total} ✅ {provider.__name__} ({model}): {result}")
+                record(provider, model, started, 'ok', result)
+                diagnostics.report(f"{index+1}/{total} ✅ {provider.__name__} ({model}): {result}")
                 return result
             else:
-                await client.send_message(CHANNEL_TRASH, f"{index+1}/{total} ⚠️ {provider.__name__} странный ответ: '{result}'")
+                record(provider, model, started, 'invalid', result[:100])
+                diagnostics.report(f"{index+1}/{total} ⚠️ {provider.__name__} странный ответ: '{result}'")
+        except SyncPoolBusy:
+            # провайдер тут ни при чём — в его статистику не пишем
+            diagnostics.report(f"{index+1}/{total} ⏳ {provider.__name__}: потоки синхронных провайдеров заняты")
         except Exception as e:
-            await client.send_message(CHANNEL_TRASH, f"{index+1}/{total} ❌ {provider.__name__} ошибка: {str(e)[:100]}")
+            record(provider, model, started, 'error', str(e)[:100])
+            diagnostics.report(f"{index+1}/{total} ❌ {provider.__name__} ошибка: {str(e)[:100]}")
         return None
 
-    tasks = [call_provider(p, i) for i, p in enumerate(fallback_providers)]
-    raw_results = await asyncio.gather(*tasks)
-
-    summary = {"полезно": 0, "реклама": 0, "бесполезно": 0}
-    for result in raw_results:
-        if result in summary:
-            summary[result] += 1
+    calls = [(p.__name__, functools.partial(call_provider, p, i)) for i, p in enumerate(ranked)]
+    with metrics.timer('stage_seconds', stage='vote'):
+        summary, answers, cut_off = await run_vote(calls[:TOP_K], calls[TOP_K:], hedge_delay=HEDGE_DELAY)
 
     total_valid = sum(summary.values())
 
     if total_valid == 0:
-        await client.send_message(CHANNEL_TRASH, "❌ Ни один GPT-провайдер не дал ответ. Повтор через 30 минут.")
-        await asyncio.sleep(1800)
-        return await check_with_gpt(text, client)
-
-    await client.send_message(CHANNEL_TRASH, f"📊 Сводка: {summary}")
+        diagnostics.report("❌ Ни один GPT-провайдер не дал ответ. Пост отложен в очередь повторов.")
+        return None
 
-    if summary["полезно"] > (summary["реклама"] + summary["бесполезно"]):
-        return "полезно"
+    if cut_off:
+        diagnostics.report(f"📊 Сводка: {summary} (исход решён, не дождались: {', '.join(cut_off)})")
     else:
-        return "мусор"
+        diagnostics.report(f"📊 Сводка: {summary}")
+
+    verdict = decide(summary)
+    for name, answer in answers.items():
+        if answer is not None:
+            provider_registry.record_agreement(name, (answer == "полезно") == (verdict == "полезно"))
+    return verdict
+
+# === Пакетная проверка: в часы пик несколько постов уходят одним запросом
+# Пачка собирается до BATCH_SIZE постов или BATCH_WAIT секунд; одиночный пост и
+# длинные посты идут обычным check_with_gpt. Посты, по которым пакетные ответы
+# не разобрались ни у одного провайдера, перепроверяются по одному.
+BATCH_SIZE = 5
+BATCH_WAIT = 0.3
+BATCH_POST_LIMIT = 1000
+
+BATCH_LINE_RE = re.compile(r'^\W*(\d+)\W+([а-яА-ЯёЁ]+)', re.M)
+
+def parse_batch(response, count):
+    verdicts = {}
+    for number, word in BATCH_LINE_RE.findall(response or ""):
+        verdicts.setdefault(int(number), word.lower())
+    result = [verdicts.get(i + 1) for i in range(count)]
+    if any(v not in VERDICTS for v in result):
+        return None
+    return result
+
+async def check_batch_with_gpt(items):
+    if len(items) == 1:
+        return [await check_with_gpt(*items[0])]
+
+    count = len(items)
+    posts = "\n\n".join(f"[{i + 1}]\n\"\"\"{clean_for_prompt(text)}\"\"\"" for i, (text, _, _) in enumerate(items))
+    prompt = (
+        PROMPT_RULES +
+        f"Analyze each of these {count} numbered posts independently:\n\n{posts}\n\n"
+        f"Output exactly {count} lines, one per post, in the form '<number>: <word>', where <word> is ONLY one "
+        "Russian word: 'полезно', 'бесполезно', or 'реклама'. No other text."
+    )
+    fingerprints = [fingerprint for _, _, fingerprint in items]
+
+    ranked = provider_registry.ranked(TOP_K)
+    total = len(ranked)
+
+    async def call_provider(provider, index):
+        started = time.monotonic()
+        model = provider_model(provider)
+        try:
+            response = await request_completion(provider, model, prompt, timeout=30)
+        except SyncPoolBusy:
+            diagnostics.report(f"📦 {index+1}/{total} ⏳ {provider.__name__}: потоки синхронных провайдеров заняты")
+            return None
+        except Exception as e:
+            record_provider_call(provider, model, time.monotonic() - started, 'error',
+                                 [(fp, str(e)[:100]) for fp in fingerprints])
+            diagnostics.report(f"📦 {index+1}/{total} ❌ {provider.__name__} ошибка: {str(e)[:100]}")
+            return None
+        verdicts = parse_batch(response, count)
+        if verdicts is None:
+            record_provider_call(provider, model, time.monotonic() - started, 'invalid',
+                                 [(fp, (response or "")[:100]) for fp in fingerprints])
+            diagnostics.report(f"📦 {index+1}/{total} ⚠️ {provider.__name__} не разобрать ответ: '{(response or '')[:100]}'")
+            return None
+        record_provider_call(provider, model, time.monotonic() - started, 'ok', list(zip(fingerprints, verdicts)))
+        diagnostics.report(f"📦 {index+1}/{total} ✅ {provider.__name__} ({model}): {', '.join(verdicts)}")
+        return verdicts
+
+    calls = [(p.__name__, functools.partial(call_provider, p, i)) for i, p in enumerate(ranked)]
+    with metrics.timer('stage_seconds', stage='batch_vote'):
+        summaries, answers, cut_off = await run_batch_vote(
+            calls[:TOP_K], count, calls[TOP_K:], hedge_delay=HEDGE_DELAY
+        )
+
+    results = []
+    fallback = []
+    for i, summary in enumerate(summaries):
+        if not sum(summary.values()):
+            results.append(None)
+            fallback.append(i)
+            continue
+        verdict = decide(summary)
+        for name, verdicts in answers.items():
+            if verdicts is not None:
+                provider_registry.record_agreement(name, (verdicts[i] == "полезно") == (verdict == "полезно"))
+        results.append(verdict)
+
+    valid = sum(verdicts is not None for verdicts in answers.values())
+    report = f"📦 Пакет из {count}: разобрали ответ {valid}/{len(answers)}, по одному перепроверяю {len(fallback)}"
+    if cut_off:
+        report += f" (исход решён, не дождались: {', '.join(cut_off)})"
+    diagnostics.report(report)
+    if fallback:
+        retried = await asyncio.gather(*(check_with_gpt(*items[i]) for i in fallback))
+        for i, verdict in zip(fallback, retried):
+            results[i] = verdict
+    return results
+
+gpt_batcher = MicroBatcher(check_batch_with_gpt, max_size=BATCH_SIZE, max_wait=BATCH_WAIT)
+
+async def classify_with_gpt(text, client, fingerprint):
+    if BATCH_SIZE <= 1 or len(clean_for_prompt(text)) > BATCH_POST_LIMIT:
+        return await check_with_gpt(text, client, fingerprint)
+    return await gpt_batcher.submit((text, client, fingerprint))
+
+# Один и тот же пост, пересланный несколькими каналами почти одновременно, проверяется один раз:
+# остальные ждут тот же результат (кэш вердиктов тут ещё пуст — первая проверка не закончилась)
+gpt_flights = SingleFlight()
+
+async def classify_and_learn(text, client, fingerprint, lemmas, prediction):
+    result = await classify_with_gpt(text, client, fingerprint)
+    if result is not None:
+        classifier.record_agreement(prediction, result)
+        classifier.learn(lemmas, result)
+        verdict_cache.put(fingerprint, result)
+    return result
+
+async def recheck_and_learn(text, client, fingerprint):
+    result = await check_with_gpt(text, client, fingerprint)
+    if result is not None:
+        verdict_cache.put(fingerprint, result)
+        classifier.learn(lemma_sequence(text), result)
+    return result
 
 # === Обработка сообщений
-async def handle_message(event, client):
-    load_filter_words()
+CLASSIFY_WORKERS = 16
+# Доставка только ставит отправку в планировщик и ждёт её; воркеров с запасом, чтобы пост,
+# застрявший в повторах или FloodWait, не держал остальные, а у планировщика была очередь
+# для приоритетов и лимитов по каналам назначения
+DELIVERY_WORKERS = SEND_CONCURRENCY * 4
+QUEUE_SIZE = 200
+STATS_INTERVAL = 300
+ALBUM_DEBOUNCE = 1.5
+
+# Справедливость по каналам: вес — доля канала в каждом круге очереди (копируемые — вперёд),
+# сколько постов одного канала классифицируется одновременно и сколько может ждать в очереди
+COPY_CHANNEL_WEIGHT = 3
+CHANNEL_WEIGHTS = {}            # channel_id: вес, перекрывает значения по умолчанию
+MAX_IN_FLIGHT_PER_CHANNEL = CLASSIFY_WORKERS // 2
+CHANNEL_QUEUE_SIZE = QUEUE_SIZE // 2
+
+# Догонялка после простоя: сколько максимум сообщений на канал и с какой скоростью
+CATCHUP_LIMIT = 1000
+CATCHUP_RATE = 5
+
+# Запись входящих событий в JSONL для воспроизведения в bench.py --replay (None — не писать)
+RECORD_EVENTS = None  # например 'recorded_events.jsonl'
+
+album_buffer = AlbumBuffer(debounce=ALBUM_DEBOUNCE)
+checkpoints = CheckpointStore('last_id.txt')
+
+def accept_message(chat, chat_id, message):
+    if message.poll or message.voice or message.video_note:
+        return None
+
+    # у альбома подпись обычно только у одной части — пустые части тоже берём
+    message_text = message.text or ""
+    if not message_text.strip() and not message.grouped_id:
+        return None
+
+    return Job(chat, chat_id, [message], message_text)
+
+# Приём: дешёвые проверки прямо в обработчике Telethon, всё тяжёлое — в очередь
+def accept_event(event):
+    metrics.inc('events_total')
+    with metrics.timer('stage_seconds', stage='channel_filter'):
+        # Только каналы (не чаты и не группы)
+        if not event.is_channel or event.chat is None or not getattr(event.chat, 'broadcast', False):
+            return None
+
+        entity_cache.remember(event.chat)
+        return accept_message(event.chat, event.chat_id, event.message)
+
+def finish_job(job):
+    for msg in job.messages:
+        checkpoints.done(job.chat_id, msg.id)
+
+def merge_album(jobs):
+    messages = [msg for job in jobs for msg in job.messages]
+    job = Job(jobs[0].chat, jobs[0].chat_id, messages, "")
+    job.text = "\n".join(msg.text.strip() for msg in job.messages if msg.text and msg.text.strip())
+    return job
+
+# Одиночный пост сразу уходит в emit, части альбома — через буфер одной задачей
+async def submit_job(job, emit):
+    checkpoints.begin(job.chat_id, job.message.id)
+    if job.message.grouped_id:
+        async def emit_album(jobs):
+            metrics.observe('stage_seconds', time.monotonic() - jobs[0].enqueued_at, stage='album')
+            album = merge_album(jobs)
+            if album.text.strip():
+                await emit(album)
+            else:
+                finish_job(album)
+        album_buffer.add((job.chat_id, job.message.grouped_id), job, emit_album)
+    else:
+        await emit(job)
 
-    # Только каналы (не чаты и не группы)
-    if not event.is_channel or event.chat is None or not getattr(event.chat, 'broadcast', False):
-        return
+def record_verdict(job, fingerprint, verdict, source):
+    metrics.inc('verdicts_total', verdict=verdict, source=source)
+    store.insert(
+        'verdicts', ts=time.time(), chat_id=job.chat_id, message_id=job.message.id,
+        content_hash=fingerprint, verdict=verdict, source=source
+    )
 
-    if event.poll or event.voice or event.video_note:
-        return
+async def classify_job(job, client):
+    load_filter_words()
+    message_text = job.text
 
-    message_text = event.message.text or ""
-    if not message_text.strip():
-        return
+    fingerprint = content_fingerprint(sanitize_input(message_text), [media_signature(m) for m in job.messages])
+    store.insert(
+        'posts', ts=time.time(), chat_id=job.chat_id, message_id=job.message.id,
+        grouped_id=job.message.grouped_id, content_hash=fingerprint,
+        parts=len(job.messages), text_len=len(message_text)
+    )
 
     if len(message_text) > 2000:
-        await client.send_message(CHANNEL_TRASH, f"⚠️ Сообщение обрезано до 2000 символов (было {len(message_text)})")
+        diagnostics.report(f"⚠️ Сообщение обрезано до 2000 символов (было {len(message_text)})")
+
+    with metrics.timer('stage_seconds', stage='lemmatize'):
+        lemmas = lemma_sequence(message_text)
+    with metrics.timer('stage_seconds', stage='filter_words'):
+        stop = filter_index.find(lemmas)
+    if stop is not None:
+        print(f"[FILTER] Сработало правило: {stop}")
+        record_verdict(job, fingerprint, 'стоп-слово', 'filter')
+        return False
+
+    job.signature = near_dup_index.signature(lemmas)
+    duplicate = near_dup_index.query(job.signature)
+    if duplicate is not None and NEAR_DUP_ACTION == 'drop':
+        print(f"[DUP] Почти-дубликат уже отправленного поста (сходство {duplicate[1]:.0%}), пропускаю")
+        record_verdict(job, fingerprint, 'дубликат', 'dup')
+        return False
+
+    result = verdict_cache.get(fingerprint)
+    if result is not None:
+        print(f"[CACHE] Вердикт из кэша: {result} (hit rate {verdict_cache.stats()['hit_rate']:.0%})")
+        source = 'cache'
+    elif duplicate is not None:
+        result = duplicate[0]
+        print(f"[DUP] Почти-дубликат (сходство {duplicate[1]:.0%}), беру прошлый вердикт: {result}")
+        source = 'dup'
+    else:
+        with metrics.timer('stage_seconds', stage='local_classifier'):
+            prediction = classifier.predict(lemmas)
+        result = classifier.decide(prediction)
+        if result is not None:
+            print(f"[LOCAL] Вердикт предклассификатора: {result} ({prediction[1]:.1%})")
+            source = 'local'
+        else:
+            result = await gpt_flights.do(
+                fingerprint, lambda: classify_and_learn(message_text, client, fingerprint, lemmas, prediction)
+            )
+            if result is None:
+                retry_scheduler.schedule(job.chat_id, [m.id for m in job.messages], message_text, fingerprint)
+                record_verdict(job, fingerprint, 'отложено', 'retry')
+                return False
+            source = 'gpt'
+
+    record_verdict(job, fingerprint, result, source)
+    job.result = result
+    return True
+
+# Повтор отложенного поста: сообщения перечитываются из Telegram, доставка — общей очередью
+# Вердикт мог уже появиться в кэше (другой отложенный пост с тем же текстом), тогда в GPT не ходим
+async def retry_job(entry, client, pipeline):
+    fingerprint = entry['fingerprint']
+    result = verdict_cache.get(fingerprint)
+    if result is None:
+        result = await gpt_flights.do(fingerprint, lambda: recheck_and_learn(entry['text'], client, fingerprint))
+    if result is None:
+        return False
+
+    messages = [m for m in await client.get_messages(entry['chat_id'], ids=entry['message_ids']) if m is not None]
+    if not messages:
+        print(f"[!] Отложенный пост {entry['key']} удалён из канала, пропускаю")
+        return True
+
+    job = Job(await messages[0].get_chat(), entry['chat_id'], messages, entry['text'])
+    job.result = result
+    record_verdict(job, entry['fingerprint'], result, 'retry')
+    job.signature = near_dup_index.signature(lemma_sequence(entry['text']))
+    await pipeline.outbox.put(job)
+    return True
+
+def record_delivery(job, target, mode, error=None):
+    metrics.inc('deliveries_total', mode=mode, ok=int(error is None))
+    store.insert(
+        'deliveries', ts=time.time(), chat_id=job.chat_id, message_id=job.message.id,
+        target=target, mode=mode, ok=int(error is None), error=error
+    )
 
-    normalized = normalize_text(message_text)
-    if filter_words.intersection(normalized):
-        return
+# Диагностика — тоже через планировщик, но после постов и без повторов (не ушло — останется в логе)
+def send_diagnostics(client, text):
+    return sender.send(
+        CHANNEL_TRASH, lambda: client.send_message(CHANNEL_TRASH, text),
+        priority=PRIORITY_DIAGNOSTICS, max_attempts=1, label='диагностика'
+    )
 
-    result = await check_with_gpt(message_text, client)
+async def deliver_job(job, client):
+    started = time.monotonic()
+    try:
+        await send_job(job, client)
+    finally:
+        metrics.observe('stage_seconds', time.monotonic() - started, stage='delivery')
 
-    messages_to_forward = [event.message]
-    if event.message.grouped_id:
-        async for msg in client.iter_messages(event.chat_id, min_id=event.message.id - 10, max_id=event.message.id + 10):
-            if msg.grouped_id == event.message.grouped_id and msg.id != event.message.id:
-                messages_to_forward.append(msg)
-    messages_to_forward.sort(key=lambda m: m.id)
+async def send_job(job, client):
+    message = job.message
+    messages_to_forward = job.messages
 
     # Определение источника
     original_channel_id = None
     source_url = None
 
-    if event.message.fwd_from and getattr(event.message.fwd_from.from_id, 'channel_id', None):
-        original_channel_id = event.message.fwd_from.from_id.channel_id
-    elif getattr(event.chat, "id", None) in COPY_CHANNELS:
-        original_channel_id = event.chat.id
+    if message.fwd_from and getattr(message.fwd_from.from_id, 'channel_id', None):
+        original_channel_id = message.fwd_from.from_id.channel_id
+    elif getattr(job.chat, "id", None) in COPY_CHANNELS:
+        original_channel_id = job.chat.id
 
     if original_channel_id in COPY_CHANNELS:
-        source_url = COPY_CHANNELS[original_channel_id]
+        source_url = await copy_source(client, original_channel_id)
 
     is_copy = source_url is not None
-    target_channel = CHANNEL_GOOD if result == "полезно" else CHANNEL_TRASH
+    target_channel = CHANNEL_GOOD if job.result == "полезно" else CHANNEL_TRASH
+    near_dup_index.add(job.signature, job.result)
 
     if is_copy:
         media_files = []
@@ -195,34 +641,292 @@ async def handle_message(event, client):
 
         if media_files:
             try:
-                await client.send_file(
+                await sender.send(
                     target_channel,
-                    file=media_files,
-                    caption=full_text,
-                    force_document=False
+                    lambda: client.send_file(
+                        target_channel,
+                        file=media_files,
+                        caption=full_text,
+                        force_document=False
+                    ),
+                    cost=len(media_files), label=f"копия {job.chat_id}/{message.id}"
                 )
             except Exception as e:
                 print(f"[!] Ошибка отправки медиа: {e}")
+                record_delivery(job, target_channel, 'copy', str(e)[:200])
+                return
         else:
-            await client.send_message(target_channel, full_text)
+            try:
+                await sender.send(
+                    target_channel, lambda: client.send_message(target_channel, full_text),
+                    label=f"копия {job.chat_id}/{message.id}"
+                )
+            except Exception as e:
+                record_delivery(job, target_channel, 'copy', str(e)[:200])
+                raise
 
+        record_delivery(job, target_channel, 'copy')
         print(f"[OK] Копия с источника: {source_url}")
     else:
-        await client.forward_messages(target_channel, messages=messages_to_forward, from_peer=event.chat_id)
+        try:
+            await sender.send(
+                target_channel,
+                lambda: client.forward_messages(target_channel, messages=messages_to_forward, from_peer=job.chat_id),
+                cost=len(messages_to_forward), label=f"репост {job.chat_id}/{message.id}"
+            )
+        except Exception as e:
+            record_delivery(job, target_channel, 'forward', str(e)[:200])
+            raise
+        record_delivery(job, target_channel, 'forward')
         print("[OK] Репост обычным способом")
 
+# === Догонялка: всё, что вышло в каналах, пока юзербот лежал
+# Диапазон канала — от чекпоинта до самого нового сообщения на момент старта, всё новее
+# приходит живым обработчиком. Пока граница не прочитана, чекпоинт канала стоит на месте;
+# дальше диапазон — пропуск в checkpoints: чекпоинт идёт за живыми постами, а недогнанный
+# хвост пропуска сохраняется рядом с ним и дочитывается при повторе или следующем запуске.
+# Сообщение из диапазона, которое успели увидеть оба пути, обрабатывает тот, кто взял
+# его первым (catchup_claims).
+CATCHUP_ATTEMPTS = 5
+CATCHUP_RETRY_DELAY = 300
+
+catchup_claims = {}       # chat_id -> id сообщений, уже взятых в работу, пока канал догоняется
+catchup_unbounded = set() # каналы, у которых верхняя граница ещё не прочитана
+
+# Вызывается до регистрации живого обработчика
+def begin_catch_up():
+    for chat_id, last_id in checkpoints.last_ids.items():
+        catchup_claims[chat_id] = set()
+        catchup_unbounded.add(chat_id)
+        checkpoints.hold(chat_id, last_id)
+
+def claim_message(chat_id, message_id):
+    claims = catchup_claims.get(chat_id)
+    if claims is None:
+        return True
+    if message_id in claims:
+        return False
+    claims.add(message_id)
+    return True
+
+def set_catch_up_bound(chat_id, upper):
+    last_id = checkpoints.get(chat_id)
+    if upper > last_id:
+        checkpoints.open_gap(chat_id, last_id, upper)
+    catchup_unbounded.discard(chat_id)
+    checkpoints.release(chat_id)
+
+async def read_catch_up_bound(client, chat_id):
+    chat = await client.get_entity(chat_id)
+    upper = checkpoints.get(chat_id)
+    async for message in client.iter_messages(chat, limit=1):
+        upper = message.id
+    set_catch_up_bound(chat_id, upper)
+
+# Границу так и не прочитали: пропущенное — всё до первого живого сообщения
+def give_up_bound(chat_id):
+    claims = catchup_claims.get(chat_id)
+    if claims:
+        set_catch_up_bound(chat_id, min(claims) - 1)
+    else:
+        catchup_unbounded.discard(chat_id)
+        checkpoints.release(chat_id)
+        print(f"[!] Догонялка: {chat_id} — граница не прочитана, пропущенное за простой не догнано")
+
+async def catch_up_range(client, pipeline, chat, chat_id, start, end):
+    count = 0
+    seen = 0
+    reached = start
+    async for message in client.iter_messages(
+        chat, min_id=start, max_id=end + 1, reverse=True, limit=CATCHUP_LIMIT, wait_time=1
+    ):
+        seen += 1
+        job = accept_message(chat, chat_id, message)
+        submitted = job is not None and claim_message(chat_id, message.id)
+        if submitted:
+            await submit_job(job, pipeline.submit)
+            count += 1
+        # сообщение уже в работе (или не нужно) — его недогнанным больше не считаем
+        reached = message.id
+        checkpoints.gap_progress(chat_id, end, reached)
+        if submitted:
+            await asyncio.sleep(1 / CATCHUP_RATE)
+    if count:
+        print(f"[SYSTEM] Догонялка: {chat_id} — {count} пропущенных сообщений в очереди")
+    if seen >= CATCHUP_LIMIT and reached < end:
+        print(
+            f"[!] Догонялка: {chat_id} — сверх CATCHUP_LIMIT={CATCHUP_LIMIT} пропущено "
+            f"до {end - reached} сообщений (id {reached + 1}..{end})"
+        )
+    checkpoints.close_gap(chat_id, end)
+
+async def catch_up_channel(client, pipeline, chat_id):
+    if chat_id in catchup_unbounded:
+        await read_catch_up_bound(client, chat_id)
+    gaps = checkpoints.gaps(chat_id)
+    if gaps:
+        chat = await client.get_entity(chat_id)
+        for start, end in gaps:
+            await catch_up_range(client, pipeline, chat, chat_id, start, end)
+
+async def catch_up(client, pipeline):
+    pending = list(checkpoints.last_ids)
+    try:
+        # сначала границы всех каналов — чтобы чекпоинты не стояли, пока догоняются соседи
+        for chat_id in pending:
+            try:
+                await read_catch_up_bound(client, chat_id)
+            except Exception as e:
+                print(f"[!] Догонялка: не удалось прочитать границу {chat_id}: {e}")
+        for attempt in range(1, CATCHUP_ATTEMPTS + 1):
+            failed = []
+            for chat_id in pending:
+                try:
+                    await catch_up_channel(client, pipeline, chat_id)
+                except Exception as e:
+                    print(f"[!] Догонялка для {chat_id} не удалась (попытка {attempt}/{CATCHUP_ATTEMPTS}): {e}")
+                    failed.append(chat_id)
+                else:
+                    catchup_claims.pop(chat_id, None)
+            pending = failed
+            if not pending:
+                return
+            if attempt < CATCHUP_ATTEMPTS:
+                await asyncio.sleep(CATCHUP_RETRY_DELAY)
+        for chat_id in pending:
+            print(f"[!] Догонялка: {chat_id} — недогнанное сохранено в чекпоинте, дочитаем при следующем запуске")
+    finally:
+        for chat_id in list(catchup_unbounded):
+            give_up_bound(chat_id)
+        catchup_claims.clear()
+
+async def stats_loop(pipeline):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        stats = pipeline.stats()
+        print(
+            f"[QUEUE] очередь: {stats['intake_depth']}/{stats['outbox_depth']} | "
+            f"ожидание avg {stats['wait']['avg']:.2f}s max {stats['wait']['max']:.2f}s | "
+            f"классификация avg {stats['classify']['avg']:.2f}s ({stats['classify']['count']}) | "
+            f"доставка avg {stats['deliver']['avg']:.2f}s ({stats['deliver']['count']})"
+        )
+        depths = sorted(pipeline.intake.depths().items(), key=lambda item: item[1], reverse=True)[:3]
+        if depths:
+            print(f"[QUEUE] больше всего ждут: {', '.join(f'{channel_label(chat_id)}={n}' for chat_id, n in depths)}")
+        batches = gpt_batcher.stats()
+        flights = gpt_flights.stats()
+        print(
+            f"[BATCH] пачек {batches['batches']}, постов {batches['items']}, в среднем {batches['avg_size']:.1f} | "
+            f"одинаковых проверок склеено: {flights['coalesced']}"
+        )
+        local = classifier.stats()
+        print(
+            f"[LOCAL] примеров {local['docs']} | решено сам {local['decided']} | "
+            f"согласие с GPT {local['agreement']:.1%}, уверенных {local['agreement_confident']:.1%} "
+            f"({local['compared_confident']})"
+        )
+
+# event.chat_id у каналов — -100XXXXXXXXXX, в настройках — голый channel_id
+def bare_channel_id(chat_id):
+    if chat_id <= -1000000000000:
+        return -chat_id - 1000000000000
+    return abs(chat_id)
+
+def channel_weight(chat_id):
+    channel_id = bare_channel_id(chat_id)
+    if channel_id in CHANNEL_WEIGHTS:
+        return CHANNEL_WEIGHTS[channel_id]
+    return COPY_CHANNEL_WEIGHT if channel_id in COPY_CHANNELS else 1
+
+def build_pipeline(client):
+    pipeline = Pipeline(
+        lambda job: classify_job(job, client),
+        lambda job: deliver_job(job, client),
+        workers=CLASSIFY_WORKERS,
+        delivery_workers=DELIVERY_WORKERS,
+        maxsize=QUEUE_SIZE,
+        on_done=finish_job,
+        weight=channel_weight,
+        max_in_flight=MAX_IN_FLIGHT_PER_CHANNEL,
+        channel_maxsize=CHANNEL_QUEUE_SIZE,
+    )
+    metrics.gauge('queue_depth', pipeline.intake.qsize, queue='intake')
+    metrics.gauge('queue_depth', pipeline.outbox.qsize, queue='outbox')
+    metrics.gauge('gpt_coalesced', lambda: gpt_flights.coalesced)
+    metrics.gauge('queue_channels', lambda: len(pipeline.intake.depths()), queue='intake')
+    metrics.gauge('queue_wait_max_seconds', lambda: pipeline.wait.max)
+    metrics.gauge('albums_pending', album_buffer.pending)
+    metrics.gauge('retry_queue_size', lambda: len(retry_scheduler.entries))
+    metrics.gauge('verdict_cache_hit_rate', lambda: verdict_cache.stats()['hit_rate'])
+    for key in ('size', 'hits', 'misses', 'hit_rate'):
+        metrics.gauge(f'lemma_cache_{key}', lambda key=key: lemma_cache_stats()[key])
+    for key in ('pending', 'sent', 'failed', 'retries', 'flood_waits', 'flood_wait_seconds'):
+        metrics.gauge(f'send_{key}', lambda key=key: sender.stats()[key])
+    metrics.gauge('provider_pool_size', lambda: len(provider_registry.providers))
+    metrics.gauge('local_classifier_agreement', lambda: classifier.stats()['agreement'])
+    metrics.gauge('local_classifier_agreement_confident', lambda: classifier.stats()['agreement_confident'])
+    return pipeline
+
 # === Запуск клиента
 async def main():
     client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
     await client.start()
+    filter_index.refresh(force=True)
+
+    pipeline = build_pipeline(client)
+    pipeline.start()
+
+    recorder = EventRecorder(RECORD_EVENTS) if RECORD_EVENTS else None
+
+    begin_catch_up()
 
     # ИСПРАВЛЕНО: слушаем ВСЕ входящие — иначе форвард из каналов вне COPY_CHANNELS не работает
     @client.on(events.NewMessage(incoming=True))
     async def handler(event):
-        await handle_message(event, client)
+        if recorder is not None:
+            recorder.record(event)
+        job = accept_event(event)
+        if job is not None and claim_message(job.chat_id, job.message.id):
+            await submit_job(job, pipeline.submit)
+
+    store_task = asyncio.create_task(store.run())
+    autosave_task = asyncio.create_task(autosave_loop())
+    stats_task = asyncio.create_task(stats_loop(pipeline))
+    retry_task = asyncio.create_task(retry_scheduler.run(lambda entry: retry_job(entry, client, pipeline)))
+    sender_task = asyncio.create_task(sender.run())
+    diagnostics_task = asyncio.create_task(diagnostics.run(lambda text: send_diagnostics(client, text)))
+    catch_up_task = asyncio.create_task(catch_up(client, pipeline))
+    prober_task = asyncio.create_task(provider_prober.run())
+    entity_refresh_task = asyncio.create_task(entity_cache.refresh_loop(client, interval=ENTITY_REFRESH_INTERVAL))
+    metrics_tasks = []
+    if METRICS_PORT:
+        metrics_tasks.append(asyncio.create_task(metrics.serve('127.0.0.1', METRICS_PORT)))
+    if METRICS_FILE:
+        metrics_tasks.append(asyncio.create_task(metrics.dump_loop(METRICS_FILE, METRICS_DUMP_INTERVAL)))
 
     print("[SYSTEM] Юзербот запущен и отслеживает все каналы.")
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        autosave_task.cancel()
+        stats_task.cancel()
+        retry_task.cancel()
+        diagnostics_task.cancel()
+        catch_up_task.cancel()
+        await asyncio.gather(catch_up_task, return_exceptions=True)
+        prober_task.cancel()
+        entity_refresh_task.cancel()
+        for task in metrics_tasks:
+            task.cancel()
+        await album_buffer.drain()
+        await pipeline.stop()
+        sender_task.cancel()
+        provider_registry.save()
+        checkpoints.flush()
+        if recorder is not None:
+            recorder.close()
+        store_task.cancel()
+        store.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
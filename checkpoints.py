@@ -0,0 +1,161 @@
+import os
+
+
+# === Чекпоинты по каналам (last_id.txt, строки "chat_id:last_id[:start-end,...]")
+# Сохраняется наибольший id, до которого включительно всё уже обработано:
+# пока в канале есть сообщения в работе, чекпоинт не перепрыгивает через них.
+# На диск пишется пачкой — раз в flush_every обновлений или по вызову flush().
+# hold() не даёт чекпоинту уйти дальше заданного id, release() снимает ограничение.
+#
+# Пропуски (start, end] — диапазоны, которые ещё догоняются: чекпоинт идёт за живыми
+# сообщениями, а недогнанный хвост диапазона сохраняется рядом с ним и дочитывается
+# при следующем запуске. Сообщения из пропуска в чекпоинт не попадают.
+class CheckpointStore:
+    def __init__(self, path='last_id.txt', flush_every=50):
+        self.path = path
+        self.flush_every = flush_every
+        self.last_ids = {}
+        self._completed = {}
+        self._in_flight = {}
+        self._holds = {}
+        # chat_id -> {end: [start, reached, finished]}, id в работе из пропусков
+        self._gaps = {}
+        self._gap_in_flight = {}
+        self._dirty = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or ':' not in line:
+                    continue
+                chat_id, last_id, *rest = line.split(':')
+                try:
+                    chat_id = int(chat_id)
+                    self.last_ids[chat_id] = int(last_id)
+                    for gap in ','.join(rest).split(','):
+                        if gap:
+                            start, end = (int(x) for x in gap.split('-'))
+                            self._gaps.setdefault(chat_id, {})[end] = [start, start, False]
+                except ValueError:
+                    print(f"[!] Пропускаю битую строку чекпоинта: {line}")
+
+    # Недогнанное начало пропуска: то, до чего дошли, но не дальше сообщений, которые ещё в работе
+    def _gap_start(self, chat_id, end, gap):
+        start, reached, _ = gap
+        busy = [i for i in self._gap_in_flight.get(chat_id, ()) if start < i <= end]
+        return min(reached, min(busy) - 1) if busy else reached
+
+    def flush(self):
+        if not self._dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for chat_id, last_id in sorted(self.last_ids.items()):
+                    gaps = ','.join(
+                        f"{self._gap_start(chat_id, end, gap)}-{end}"
+                        for end, gap in sorted(self._gaps.get(chat_id, {}).items())
+                    )
+                    f.write(f"{chat_id}:{last_id}:{gaps}\n" if gaps else f"{chat_id}:{last_id}\n")
+            os.replace(tmp_path, self.path)
+            self._dirty = 0
+        except OSError as e:
+            print(f"[!] Не удалось сохранить чекпоинты: {e}")
+
+    def _touch(self):
+        self._dirty += 1
+        if self._dirty >= self.flush_every:
+            self.flush()
+
+    def get(self, chat_id):
+        return self.last_ids.get(chat_id)
+
+    def _in_gap(self, chat_id, message_id):
+        return any(gap[0] < message_id <= end for end, gap in self._gaps.get(chat_id, {}).items())
+
+    def begin(self, chat_id, message_id):
+        if self._in_gap(chat_id, message_id):
+            self._gap_in_flight.setdefault(chat_id, set()).add(message_id)
+            return
+        self._in_flight.setdefault(chat_id, set()).add(message_id)
+
+    def done(self, chat_id, message_id):
+        if self._in_gap(chat_id, message_id):
+            self._gap_in_flight.get(chat_id, set()).discard(message_id)
+            self._close_finished(chat_id)
+            self._touch()
+            return
+
+        in_flight = self._in_flight.get(chat_id)
+        if in_flight is not None:
+            in_flight.discard(message_id)
+            if not in_flight:
+                del self._in_flight[chat_id]
+
+        self._completed[chat_id] = max(self._completed.get(chat_id, 0), message_id)
+        self._advance(chat_id)
+
+    def hold(self, chat_id, message_id):
+        self._holds[chat_id] = message_id
+        self._advance(chat_id)
+
+    def release(self, chat_id):
+        if self._holds.pop(chat_id, None) is not None:
+            self._advance(chat_id)
+
+    def _advance(self, chat_id):
+        completed = self._completed.get(chat_id)
+        if completed is None:
+            return
+        in_flight = self._in_flight.get(chat_id)
+        safe = completed if not in_flight else min(completed, min(in_flight) - 1)
+        hold = self._holds.get(chat_id)
+        if hold is not None:
+            safe = min(safe, hold)
+
+        if safe > self.last_ids.get(chat_id, 0):
+            self.last_ids[chat_id] = safe
+            self._touch()
+
+    # --- пропуски догонялки
+    def gaps(self, chat_id):
+        return [(gap[1], end) for end, gap in sorted(self._gaps.get(chat_id, {}).items())]
+
+    def open_gap(self, chat_id, start, end):
+        self._gaps.setdefault(chat_id, {})[end] = [start, start, False]
+        self.last_ids.setdefault(chat_id, start)
+        self._touch()
+
+    def gap_progress(self, chat_id, end, message_id):
+        gap = self._gaps.get(chat_id, {}).get(end)
+        if gap is not None and message_id > gap[1]:
+            gap[1] = message_id
+            self._touch()
+
+    # Догонялка прошла диапазон (или сознательно его бросила); пропуск закроется,
+    # когда доработают уже взятые из него сообщения
+    def close_gap(self, chat_id, end):
+        gap = self._gaps.get(chat_id, {}).get(end)
+        if gap is not None:
+            gap[1] = end
+            gap[2] = True
+            self._close_finished(chat_id)
+            self._touch()
+
+    def _close_finished(self, chat_id):
+        gaps = self._gaps.get(chat_id)
+        if not gaps:
+            return
+        for end, gap in list(gaps.items()):
+            if gap[2] and self._gap_start(chat_id, end, gap) >= end:
+                del gaps[end]
+                # догнанный диапазон примыкает к чекпоинту — чекпоинт может его перешагнуть
+                self._completed[chat_id] = max(self._completed.get(chat_id, 0), end)
+        if not gaps:
+            del self._gaps[chat_id]
+            self._gap_in_flight.pop(chat_id, None)
+        self._advance(chat_id)
@@ -0,0 +1,110 @@
+import math
+import random
+from collections import Counter
+
+# Служебный "токен" в таблице: сколько документов видел класс
+DOCS = ''
+
+
+# === Локальный предклассификатор: мультиномиальный наивный Байес по леммам
+# Учится только на вердиктах LLM (свои решения в обучение не попадают — иначе
+# он бы сам себя убеждал). Пока не набралось min_docs примеров каждого класса,
+# молчит. Уверенный прогноз (>= threshold) заменяет поход в LLM, кроме доли audit:
+# там LLM всё равно спрашивается, чтобы честно мерить согласие.
+class NaiveBayesClassifier:
+    def __init__(self, store, threshold=0.97, min_docs=200, alpha=1.0, audit=0.05):
+        self.store = store
+        self.threshold = threshold
+        self.min_docs = min_docs
+        self.alpha = alpha
+        self.audit = audit
+        self.docs = Counter()
+        self.tokens = {}
+        self.totals = Counter()
+        self.vocab = set()
+        self.decided = 0
+        self.compared = 0
+        self.agreed = 0
+        self.compared_confident = 0
+        self.agreed_confident = 0
+        self._load()
+
+    def _load(self):
+        for label, token, count in self.store.query("SELECT label, token, count FROM classifier_counts"):
+            if token == DOCS:
+                self.docs[label] = count
+            else:
+                self.tokens.setdefault(label, Counter())[token] = count
+                self.totals[label] += count
+                self.vocab.add(token)
+        if self.docs:
+            print(f"[SYSTEM] Предклассификатор: {dict(self.docs)} примеров, словарь {len(self.vocab)}")
+
+    def _bump(self, label, token, count):
+        self.store.execute(
+            "INSERT INTO classifier_counts (label, token, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (label, token) DO UPDATE SET count = count + excluded.count",
+            (label, token, count)
+        )
+
+    def ready(self):
+        return len(self.docs) >= 2 and min(self.docs.values()) >= self.min_docs
+
+    def learn(self, features, label):
+        counts = self.tokens.setdefault(label, Counter())
+        for token in set(features):
+            counts[token] += 1
+            self.totals[label] += 1
+            self.vocab.add(token)
+            self._bump(label, token, 1)
+        self.docs[label] += 1
+        self._bump(label, DOCS, 1)
+
+    # (метка, уверенность) или None, пока модель не обучена
+    def predict(self, features):
+        if not self.ready():
+            return None
+        features = set(features)
+        total_docs = sum(self.docs.values())
+        vocab = len(self.vocab) + 1
+        scores = {}
+        for label, docs in self.docs.items():
+            counts = self.tokens.get(label, {})
+            denom = math.log(self.totals[label] + self.alpha * vocab)
+            score = math.log(docs / total_docs)
+            for token in features:
+                score += math.log(counts.get(token, 0) + self.alpha) - denom
+            scores[label] = score
+        best = max(scores, key=scores.get)
+        # softmax по логарифмам: вероятность лучшего класса
+        confidence = 1.0 / sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, confidence
+
+    # Решить самим или всё-таки спросить LLM
+    def decide(self, prediction):
+        if prediction is None or prediction[1] < self.threshold:
+            return None
+        if random.random() < self.audit:
+            return None
+        self.decided += 1
+        return prediction[0]
+
+    def record_agreement(self, prediction, verdict):
+        if prediction is None:
+            return
+        agreed = prediction[0] == verdict
+        self.compared += 1
+        self.agreed += agreed
+        if prediction[1] >= self.threshold:
+            self.compared_confident += 1
+            self.agreed_confident += agreed
+
+    def stats(self):
+        return {
+            "docs": dict(self.docs),
+            "vocab": len(self.vocab),
+            "decided": self.decided,
+            "agreement": self.agreed / self.compared if self.compared else 0.0,
+            "agreement_confident": self.agreed_confident / self.compared_confident if self.compared_confident else 0.0,
+            "compared_confident": self.compared_confident,
+        }
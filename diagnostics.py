@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import deque
+
+TELEGRAM_MESSAGE_LIMIT = 4000
+
+
+# === Диагностика: буфер вместо отдельного сообщения на каждый ответ провайдера
+# report() ничего не ждёт; раз в interval секунд накопленное уходит одним дайджестом
+# (mode='channel') или дописывается в лог (mode='log'). Что не влезло в дайджест
+# или не отправилось — тоже в лог.
+class DiagnosticsSink:
+    def __init__(self, mode='channel', interval=60, max_buffer=1000, log_path='diagnostics.log'):
+        self.mode = mode
+        self.interval = interval
+        self.log_path = log_path
+        self.buffer = deque(maxlen=max_buffer)
+        self.dropped = 0
+        self.sent = 0
+
+    def report(self, line):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(f"{time.strftime('%H:%M:%S')} {line}")
+
+    def _write_log(self, lines):
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line + "\n")
+        except OSError as e:
+            print(f"[!] Не удалось записать диагностику в лог: {e}")
+
+    def _digest(self, lines):
+        header = f"🧾 Диагностика ({len(lines)} событий"
+        if self.dropped:
+            header += f", потеряно {self.dropped}"
+        header += "):"
+        body = []
+        size = len(header)
+        overflow = []
+        for i, line in enumerate(lines):
+            if size + len(line) + 1 > TELEGRAM_MESSAGE_LIMIT - 40:
+                overflow = lines[i:]
+                break
+            body.append(line)
+            size += len(line) + 1
+        if overflow:
+            body.append(f"… ещё {len(overflow)} в {self.log_path}")
+        return "\n".join([header] + body), overflow
+
+    async def flush(self, send=None):
+        if not self.buffer:
+            return
+        lines = list(self.buffer)
+        self.buffer.clear()
+
+        if self.mode != 'channel' or send is None:
+            self._write_log(lines)
+            return
+
+        text, overflow = self._digest(lines)
+        self.dropped = 0
+        if overflow:
+            self._write_log(overflow)
+        try:
+            await send(text)
+            self.sent += 1
+        except Exception as e:
+            print(f"[!] Не удалось отправить диагностику: {e}")
+            self._write_log(lines)
+
+    async def run(self, send):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.flush(send)
+        finally:
+            # при остановке досылаем хвост в лог, чтобы не ждать сеть
+            if self.buffer:
+                self._write_log(list(self.buffer))
+                self.buffer.clear()
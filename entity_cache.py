@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from telethon.errors import FloodWaitError, RPCError
+from telethon.tl.types import PeerChannel
+
+from singleflight import SingleFlight
+
+
+# === Кэш каналов: id, username, title
+# Живёт в памяти, изменения пишутся в таблицу channel_entities общего хранилища,
+# так что подпись источника после первой встречи канала собирается без сети.
+# Устаревшие записи (старше ttl) отдаются как есть, обновляет их refresh_loop.
+# Недоступные каналы (приватные, удалённые) запоминаются на negative_ttl, чтобы
+# не спрашивать о них Telegram на каждом посте. FloodWait и сетевые ошибки
+# в кэш не попадают.
+class EntityCache:
+    def __init__(self, store, ttl=24 * 3600, negative_ttl=6 * 3600):
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self._entries = {}
+        self._flights = SingleFlight()
+        self._load()
+
+    def _load(self):
+        rows = self.store.query("SELECT channel_id, username, title, ok, ts FROM channel_entities")
+        for channel_id, username, title, ok, ts in rows:
+            self._entries[channel_id] = {"id": channel_id, "username": username, "title": title, "ok": bool(ok), "ts": ts}
+
+    def _put(self, channel_id, username, title, ok):
+        entry = {"id": channel_id, "username": username, "title": title, "ok": ok, "ts": time.time()}
+        self._entries[channel_id] = entry
+        self.store.execute(
+            "INSERT OR REPLACE INTO channel_entities (channel_id, username, title, ok, ts) VALUES (?, ?, ?, ?, ?)",
+            (channel_id, username, title, int(ok), entry["ts"])
+        )
+        return entry
+
+    def _stale(self, entry, now):
+        return now - entry["ts"] >= (self.ttl if entry["ok"] else self.negative_ttl)
+
+    # Канал пришёл вместе с событием — запоминаем без запроса в сеть.
+    # Пишем только если что-то поменялось или запись устарела.
+    def remember(self, entity):
+        channel_id = getattr(entity, "id", None)
+        if channel_id is None:
+            return None
+        username = getattr(entity, "username", None)
+        title = getattr(entity, "title", None)
+        entry = self._entries.get(channel_id)
+        if (entry is not None and entry["ok"] and entry["username"] == username
+                and entry["title"] == title and not self._stale(entry, time.time())):
+            return entry
+        return self._put(channel_id, username, title, True)
+
+    def get(self, channel_id):
+        entry = self._entries.get(channel_id)
+        return entry if entry is not None and entry["ok"] else None
+
+    async def _fetch(self, client, channel_id):
+        self.lookups += 1
+        try:
+            entity = await client.get_entity(PeerChannel(channel_id))
+        except FloodWaitError:
+            raise
+        except (ValueError, RPCError) as e:
+            print(f"[ENTITY] Канал {channel_id} недоступен: {e}")
+            return self._put(channel_id, None, None, False)
+        return self._put(channel_id, getattr(entity, "username", None), getattr(entity, "title", None), True)
+
+    # Запись о канале или None, если канал недоступен. В сеть — только при первой
+    # встрече или когда истёк negative_ttl; одновременные запросы одного канала склеиваются.
+    async def lookup(self, client, channel_id):
+        entry = self._entries.get(channel_id)
+        if entry is not None and entry["ok"]:
+            self.hits += 1
+            return entry
+        if entry is not None and not self._stale(entry, time.time()):
+            self.negative_hits += 1
+            return None
+        self.misses += 1
+        try:
+            entry = await self._flights.do(channel_id, lambda: self._fetch(client, channel_id))
+        except Exception as e:
+            print(f"[!] Не удалось получить канал {channel_id}: {e}")
+            return None
+        return entry if entry["ok"] else None
+
+    # Фоновое обновление: раз в interval перезапрашивает до batch самых старых устаревших записей
+    async def refresh_loop(self, client, interval=600, batch=20, pause=2):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            stale = sorted((e for e in self._entries.values() if self._stale(e, now)), key=lambda e: e["ts"])
+            refreshed = 0
+            for entry in stale[:batch]:
+                channel_id = entry["id"]
+                try:
+                    await self._flights.do(channel_id, lambda: self._fetch(client, channel_id))
+                    refreshed += 1
+                except FloodWaitError as e:
+                    print(f"[FLOOD] Обновление кэша каналов на паузе {e.seconds}s")
+                    await asyncio.sleep(e.seconds + 1)
+                    break
+                except Exception as e:
+                    print(f"[!] Не удалось обновить канал {channel_id}: {e}")
+                await asyncio.sleep(pause)
+            if refreshed:
+                print(f"[ENTITY] Обновлено каналов: {refreshed}, устаревших осталось: {max(0, len(stale) - refreshed)}")
+
+    def stats(self):
+        total = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "lookups": self.lookups,
+            "hit_rate": (self.hits + self.negative_hits) / total if total else 0.0,
+        }
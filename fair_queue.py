@@ -0,0 +1,102 @@
+import asyncio
+from collections import Counter, deque
+
+
+# === Справедливая очередь по каналам (deficit round robin)
+# У каждого канала своя очередь, каналы обслуживаются по кругу: за один заход канал
+# получает weight заданий (вес >= 1, дробная часть копится между заходами).
+# max_in_flight ограничивает, сколько заданий одного канала обрабатывается
+# одновременно, channel_maxsize — сколько их может ждать, maxsize — сколько всего.
+# Интерфейс как у asyncio.Queue, только task_done() получает само задание.
+class FairQueue:
+    def __init__(self, maxsize=0, key=lambda job: job.chat_id, weight=None,
+                 max_in_flight=0, channel_maxsize=0):
+        self.maxsize = maxsize
+        self.key = key
+        self.weight = weight or (lambda key: 1)
+        self.max_in_flight = max_in_flight
+        self.channel_maxsize = channel_maxsize
+        self._queues = {}
+        self._ring = deque()
+        self._deficit = {}
+        self._in_flight = Counter()
+        self._size = 0
+        self._unfinished = 0
+        self._changed = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self):
+        return self._size
+
+    def depths(self):
+        return {key: len(queue) for key, queue in self._queues.items()}
+
+    def _full(self, key):
+        if self.maxsize and self._size >= self.maxsize:
+            return True
+        return bool(self.channel_maxsize) and len(self._queues.get(key, ())) >= self.channel_maxsize
+
+    async def _wait_change(self):
+        self._changed.clear()
+        await self._changed.wait()
+
+    async def put(self, job):
+        key = self.key(job)
+        while self._full(key):
+            await self._wait_change()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ring.append(key)
+            self._deficit[key] = 0.0
+        queue.append(job)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._changed.set()
+
+    def _pick(self):
+        # Два круга хватает: на первом каналы без кредита его получают
+        for _ in range(2 * len(self._ring)):
+            key = self._ring[0]
+            if self.max_in_flight and self._in_flight[key] >= self.max_in_flight:
+                self._ring.rotate(-1)
+                continue
+            if self._deficit[key] < 1:
+                self._deficit[key] += max(1.0, self.weight(key))
+            queue = self._queues[key]
+            job = queue.popleft()
+            self._deficit[key] -= 1
+            self._in_flight[key] += 1
+            self._size -= 1
+            if not queue:
+                # опустевший канал выходит из круга и теряет накопленный кредит
+                self._ring.popleft()
+                del self._queues[key]
+                del self._deficit[key]
+            elif self._deficit[key] < 1:
+                self._ring.rotate(-1)
+            return job
+        return None
+
+    async def get(self):
+        while True:
+            job = self._pick() if self._ring else None
+            if job is not None:
+                self._changed.set()
+                return job
+            await self._wait_change()
+
+    def task_done(self, job):
+        key = self.key(job)
+        self._in_flight[key] -= 1
+        if self._in_flight[key] <= 0:
+            del self._in_flight[key]
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._finished.set()
+        self._changed.set()
+
+    async def join(self):
+        await self._finished.wait()
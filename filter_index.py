@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import time
+
+from phrase_matcher import PhraseMatcher, parse_rule
+
+
+# === Индекс стоп-слов и стоп-фраз
+# Строка файла — слово, фраза ("розыгрыш призов") или фраза с пропуском
+# ("бесплатный * вебинар", "бесплатный *2 вебинар"); строки с # — комментарии.
+# Файл перечитывается только при изменении (mtime/size, затем sha256),
+# лемматизируются только новые слова, готовый автомат подменяется целиком.
+# Снимок слово -> лемма лежит на диске, чтобы рестарт не гонял pymorphy заново.
+class FilterIndex:
+    def __init__(self, path, lemmatize, snapshot_path=None, check_interval=5.0):
+        self.path = path
+        self.lemmatize = lemmatize
+        self.snapshot_path = snapshot_path or path + '.cache.json'
+        self.check_interval = check_interval
+
+        self.matcher = PhraseMatcher([])
+        self._lines = []
+        self._word_lemmas = {}
+        self._stat = None
+        self._sha256 = None
+        self._next_check = 0.0
+
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._word_lemmas = dict(data.get('lemmas', {}))
+            if 'rules' in data:
+                self._lines = list(data['rules'])
+                self._sha256 = data.get('sha256')
+                self.matcher = self._compile(self._lines)
+        except (OSError, ValueError) as e:
+            print(f"[!] Снимок стоп-слов повреждён, пересобираю: {e}")
+            self._word_lemmas = {}
+            self._sha256 = None
+
+    def _save_snapshot(self):
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'sha256': self._sha256, 'rules': self._lines, 'lemmas': self._word_lemmas}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"[!] Не удалось сохранить снимок стоп-слов: {e}")
+
+    def _lemma(self, word, cache):
+        lemma = cache.get(word)
+        if lemma is None:
+            lemma = self._word_lemmas.get(word)
+            if lemma is None:
+                lemma = self.lemmatize(word)
+            cache[word] = lemma
+        return lemma
+
+    def _compile(self, lines, cache=None):
+        cache = {} if cache is None else cache
+        rules = []
+        for line in lines:
+            segments, gaps = parse_rule(line)
+            if segments:
+                rules.append((line, [[self._lemma(w, cache) for w in seg] for seg in segments], gaps))
+        return PhraseMatcher(rules)
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if len(self.matcher):
+                self.matcher = PhraseMatcher([])
+                self._lines = []
+                self._word_lemmas = {}
+                self._stat = None
+                self._sha256 = None
+            return False
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._stat:
+            return False
+
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        self._stat = stat_key
+
+        sha256 = hashlib.sha256(raw).hexdigest()
+        if sha256 == self._sha256:
+            return False
+
+        lines = []
+        for line in raw.decode('utf-8').splitlines():
+            line = line.strip().lower()
+            if line and not line.startswith('#'):
+                lines.append(line)
+
+        word_lemmas = {}
+        matcher = self._compile(lines, word_lemmas)
+        added = len(set(word_lemmas) - set(self._word_lemmas))
+
+        # подмена одной ссылкой — обработчики видят либо старый, либо новый автомат
+        self.matcher = matcher
+        self._lines = lines
+        self._word_lemmas = word_lemmas
+        self._sha256 = sha256
+        self._save_snapshot()
+
+        print(f"[SYSTEM] Стоп-слова обновлены: {len(matcher)} правил, новых слов лемматизировано: {added}")
+        return True
+
+    # lemmas — последовательность лемм поста (порядок важен для фраз)
+    def find(self, lemmas):
+        return self.matcher.find(lemmas)
+
+    def matches(self, lemmas):
+        return self.matcher.matches(lemmas)
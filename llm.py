@@ -0,0 +1,85 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import g4f
+from g4f.client import AsyncClient
+
+try:
+    from g4f.providers.base_provider import AsyncProvider, AsyncGeneratorProvider
+    ASYNC_PROVIDER_TYPES = (AsyncProvider, AsyncGeneratorProvider)
+except ImportError:
+    ASYNC_PROVIDER_TYPES = ()
+
+# Синхронным провайдерам — свой ограниченный пул, а не общий executor asyncio.
+# У фоновых проверок каталога отдельный пул поменьше: зависшие на проверке
+# провайдеры не должны занимать потоки живых постов.
+SYNC_WORKERS = 4
+PROBE_SYNC_WORKERS = 2
+
+async_client = AsyncClient()
+
+
+class SyncPoolBusy(RuntimeError):
+    pass
+
+
+# Слот освобождается только когда поток действительно закончил, поэтому зависшие
+# вызовы не копятся в очереди пула. Свободного потока ждём в пределах того же
+# timeout, что и на сам вызов; не дождались — SyncPoolBusy (провайдер тут ни при чём).
+class SyncPool:
+    def __init__(self, workers, name):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.in_flight = 0
+        self._slots = asyncio.Semaphore(workers)
+
+    def _release(self, future):
+        self.in_flight -= 1
+        self._slots.release()
+        # по таймауту результат уже никому не нужен — забираем исключение, чтобы не шумело в логе
+        if not future.cancelled():
+            future.exception()
+
+    async def run(self, fn, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise SyncPoolBusy(f"за {timeout}s не освободился ни один поток синхронных провайдеров") from None
+        self.in_flight += 1
+        future = loop.run_in_executor(self.executor, fn)
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=max(0, deadline - loop.time()))
+
+
+sync_pool = SyncPool(SYNC_WORKERS, 'g4f-sync')
+probe_pool = SyncPool(PROBE_SYNC_WORKERS, 'g4f-probe')
+
+
+def is_async_provider(provider):
+    if ASYNC_PROVIDER_TYPES:
+        return isinstance(provider, type) and issubclass(provider, ASYNC_PROVIDER_TYPES)
+    return hasattr(provider, 'create_async_generator')
+
+
+# === Запрос к провайдеру
+# Асинхронные провайдеры идут через AsyncClient: таймаут реально отменяет запрос.
+# Синхронные — в pool (по умолчанию пул живых постов из SYNC_WORKERS потоков).
+async def request_completion(provider, model, prompt, timeout=30, pool=None):
+    messages = [{"role": "user", "content": prompt}]
+
+    if is_async_provider(provider):
+        response = await asyncio.wait_for(
+            async_client.chat.completions.create(model=model, messages=messages, provider=provider),
+            timeout=timeout
+        )
+        if response and response.choices:
+            return response.choices[0].message.content or ""
+        return ""
+
+    return await (pool or sync_pool).run(
+        functools.partial(g4f.ChatCompletion.create, provider=provider, model=model, messages=messages),
+        timeout
+    )
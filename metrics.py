@@ -0,0 +1,129 @@
+import asyncio
+import bisect
+import os
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм, секунды: от лемматизации (микросекунды) до ответа LLM (десятки секунд)
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+# === Метрики в памяти: счётчики, гистограммы задержек и снимаемые на лету значения
+# На горячем пути только словарь и пара сложений — можно держать включёнными всегда.
+# Наружу — в текстовом формате Prometheus: по HTTP (serve) или файлом (dump_loop).
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # fn вызывается только при выгрузке метрик
+    def gauge(self, name, fn, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def render(self):
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), fn in sorted(self.gauges.items(), key=lambda item: item[0]):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {hist.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        lines.append(f"uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            if request.split(b" ")[1:2] == [b"/metrics"]:
+                status, body = "200 OK", self.render().encode('utf-8')
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # Только на localhost: GET /metrics
+    async def serve(self, host='127.0.0.1', port=9108):
+        try:
+            server = await asyncio.start_server(self._handle, host, port)
+        except OSError as e:
+            print(f"[!] Не удалось поднять эндпоинт метрик на {host}:{port}: {e}")
+            return
+        print(f"[SYSTEM] Метрики: http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+    async def dump_loop(self, path, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    f.write(self.render())
+                os.replace(path + '.tmp', path)
+            except OSError as e:
+                print(f"[!] Не удалось записать метрики: {e}")
@@ -0,0 +1,97 @@
+import random
+import time
+import zlib
+from collections import OrderedDict
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+# === Поиск почти-дубликатов (MinHash + LSH)
+# Шинглы по k лемм подряд, сигнатура из num_perm минимумов, LSH по bands полосам.
+# Окно скользящее: записи старше window секунд или сверх max_entries выбрасываются.
+class NearDuplicateIndex:
+    def __init__(self, threshold=0.8, window=72 * 3600, max_entries=50000,
+                 num_perm=64, bands=16, shingle_size=3, min_lemmas=8):
+        if num_perm % bands:
+            raise ValueError("num_perm должен делиться на bands")
+        self.threshold = threshold
+        self.window = window
+        self.max_entries = max_entries
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_lemmas = min_lemmas
+
+        rng = random.Random(1337)
+        self._perms = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+
+        self._entries = OrderedDict()  # doc_id -> (ts, signature, band_keys, verdict)
+        self._buckets = {}             # band_key -> {doc_id}
+        self._next_id = 0
+
+    def signature(self, lemmas):
+        if len(lemmas) < self.min_lemmas:
+            return None
+        k = self.shingle_size
+        shingles = {' '.join(lemmas[i:i + k]) for i in range(len(lemmas) - k + 1)}
+        hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles]
+        return tuple(
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [(i, signature[i * r:(i + 1) * r]) for i in range(self.bands)]
+
+    def _remove(self, doc_id):
+        _, _, band_keys, _ = self._entries.pop(doc_id)
+        for key in band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _expire(self, now):
+        while self._entries:
+            doc_id, (ts, _, _, _) = next(iter(self._entries.items()))
+            if now - ts < self.window and len(self._entries) <= self.max_entries:
+                break
+            self._remove(doc_id)
+
+    def query(self, signature):
+        if signature is None:
+            return None
+        self._expire(time.time())
+
+        candidates = set()
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket:
+                candidates.update(bucket)
+
+        best = None
+        for doc_id in candidates:
+            _, other, _, verdict = self._entries[doc_id]
+            similarity = sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (verdict, similarity)
+        return best
+
+    def add(self, signature, verdict):
+        if signature is None:
+            return
+        doc_id = self._next_id
+        self._next_id += 1
+        band_keys = self._band_keys(signature)
+        self._entries[doc_id] = (time.time(), signature, band_keys, verdict)
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(doc_id)
+        self._expire(time.time())
+
+    def __len__(self):
+        return len(self._entries)
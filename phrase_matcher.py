@@ -0,0 +1,103 @@
+from collections import deque
+
+# Пропуск между словами фразы без числа: "бесплатный * вебинар" — до DEFAULT_GAP любых слов
+DEFAULT_GAP = 3
+
+
+# Строка filter_words.txt -> отрезки подряд идущих слов и допустимые пропуски между ними:
+# "розыгрыш призов"        -> [['розыгрыш', 'призов']], []
+# "бесплатный *2 вебинар"  -> [['бесплатный'], ['вебинар']], [2]
+def parse_rule(line):
+    segments = [[]]
+    gaps = []
+    for token in line.split():
+        if token.startswith('*') and (token == '*' or token[1:].isdigit()):
+            if segments[-1]:
+                segments.append([])
+                gaps.append(int(token[1:]) if token[1:] else DEFAULT_GAP)
+            continue
+        word = token.strip('.,!?:;"«»()').lower()
+        if word:
+            segments[-1].append(word)
+    if not segments[-1]:
+        segments.pop()
+        if gaps:
+            gaps.pop()
+    return segments, gaps
+
+
+# === Автомат Ахо — Корасик над последовательностью лемм
+# Алфавит — леммы целиком, поэтому один проход по посту находит все отрезки всех
+# правил сразу, и время проверки почти не зависит от того, сколько правил в списке.
+# Правила с пропусками собираются из отрезков: каждый следующий должен начаться
+# не дальше gap слов после конца предыдущего.
+class PhraseMatcher:
+    def __init__(self, rules):
+        # rules: [(текст правила, отрезки из лемм, пропуски)]
+        self.rules = [(text, gaps, len(segments)) for text, segments, gaps in rules]
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for rule_id, (_, segments, _) in enumerate(rules):
+            for seg_id, segment in enumerate(segments):
+                self._add(segment, (rule_id, seg_id, len(segment)))
+        self._build()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _add(self, segment, output):
+        state = 0
+        for lemma in segment:
+            nxt = self._goto[state].get(lemma)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][lemma] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(output)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for lemma, nxt in self._goto[state].items():
+                queue.append(nxt)
+                if state:
+                    fail = self._fail[state]
+                    while fail and lemma not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[nxt] = self._goto[fail].get(lemma, 0)
+                # выходы суффиксов наследуются, чтобы не ходить по fail-ссылкам при поиске
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    # Текст первого сработавшего правила или None
+    def find(self, lemmas):
+        goto, fail, out = self._goto, self._fail, self._out
+        # (правило, отрезок) -> где кончались найденные вхождения этого отрезка
+        partial = {}
+        state = 0
+        for pos, lemma in enumerate(lemmas):
+            while state and lemma not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(lemma, 0)
+            for rule_id, seg_id, length in out[state]:
+                text, gaps, count = self.rules[rule_id]
+                if seg_id:
+                    start = pos - length + 1
+                    ends = partial.get((rule_id, seg_id - 1))
+                    if not ends or not any(start - gaps[seg_id - 1] - 1 <= end < start for end in ends):
+                        continue
+                if seg_id == count - 1:
+                    return text
+                ends = partial.setdefault((rule_id, seg_id), [])
+                ends.append(pos)
+                # для проверки пропуска достаточно последних вхождений
+                if len(ends) > 8:
+                    del ends[:-8]
+        return None
+
+    def matches(self, lemmas):
+        return self.find(lemmas) is not None
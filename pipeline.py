@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+from fair_queue import FairQueue
+
+
+# === Задание конвейера: только то, что нужно стадиям, без самого события
+# messages — все сообщения поста (несколько, если это альбом), message — первое из них
+class Job:
+    def __init__(self, chat, chat_id, messages, text):
+        self.chat = chat
+        self.chat_id = chat_id
+        self.messages = sorted(messages, key=lambda m: m.id)
+        self.message = self.messages[0]
+        self.text = text
+        self.result = None
+        self.signature = None
+        self.enqueued_at = time.monotonic()
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+# === Конвейер: приём -> очередь -> пул классификаторов -> очередь -> доставка
+# Очереди ограничены: если классификаторы не успевают, submit() ждёт (backpressure).
+# Обе очереди справедливые по каналам (FairQueue): weight(chat_id) — доля канала,
+# max_in_flight — сколько его постов классифицируется одновременно.
+# on_done вызывается, когда задание покинуло конвейер — отфильтровано, доставлено или упало.
+class Pipeline:
+    def __init__(self, classify, deliver, workers=4, delivery_workers=1, maxsize=200, on_done=None,
+                 weight=None, max_in_flight=0, channel_maxsize=0):
+        self.classify = classify
+        self.deliver = deliver
+        self.on_done = on_done
+        self.workers = workers
+        self.delivery_workers = delivery_workers
+        self.intake = FairQueue(maxsize, weight=weight, max_in_flight=max_in_flight, channel_maxsize=channel_maxsize)
+        self.outbox = FairQueue(maxsize, weight=weight)
+        self.wait = StageStats()
+        self.classify_stats = StageStats()
+        self.deliver_stats = StageStats()
+        self._tasks = []
+
+    async def submit(self, job):
+        job.enqueued_at = time.monotonic()
+        await self.intake.put(job)
+
+    def _done(self, job):
+        if self.on_done is not None:
+            self.on_done(job)
+
+    async def _classify_worker(self):
+        while True:
+            job = await self.intake.get()
+            started = time.monotonic()
+            self.wait.observe(started - job.enqueued_at)
+            try:
+                if await self.classify(job):
+                    await self.outbox.put(job)
+                else:
+                    self._done(job)
+            except Exception as e:
+                self.classify_stats.errors += 1
+                print(f"[!] Ошибка классификации: {e}")
+                self._done(job)
+            finally:
+                self.classify_stats.observe(time.monotonic() - started)
+                self.intake.task_done(job)
+
+    async def _deliver_worker(self):
+        while True:
+            job = await self.outbox.get()
+            started = time.monotonic()
+            try:
+                await self.deliver(job)
+                self._done(job)
+            except Exception as e:
+                self.deliver_stats.errors += 1
+                print(f"[!] Ошибка доставки: {e}")
+                self._done(job)
+            finally:
+                self.deliver_stats.observe(time.monotonic() - started)
+                self.outbox.task_done(job)
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._classify_worker()))
+        for _ in range(self.delivery_workers):
+            self._tasks.append(asyncio.create_task(self._deliver_worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self):
+        return {
+            "intake_depth": self.intake.qsize(),
+            "outbox_depth": self.outbox.qsize(),
+            "wait": self.wait.snapshot(),
+            "classify": self.classify_stats.snapshot(),
+            "deliver": self.deliver_stats.snapshot(),
+        }
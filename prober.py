@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import g4f
+
+from llm import SyncPoolBusy
+
+PROBE_PROMPT = "Answer with one word: is a tomato red or purple?"
+
+# Технические базовые классы, которые нельзя запустить
+TECHNICAL_CLASSES = {"BaseProvider", "AsyncProvider", "AsyncGeneratorProvider", "ProviderUtils"}
+
+
+def all_providers():
+    if hasattr(g4f.Provider, '__providers__'):
+        raw = g4f.Provider.__providers__
+    else:
+        raw = list(g4f.Provider.__map__.values())
+    seen = set()
+    providers = []
+    for p in raw:
+        if p and p.__name__ not in TECHNICAL_CLASSES and p not in seen:
+            seen.add(p)
+            providers.append(p)
+    return providers
+
+
+def provider_by_name(name):
+    return getattr(g4f.Provider, name, None)
+
+
+def candidate_models(provider, limit=1):
+    # Модель по умолчанию, затем остальные из списка провайдера; если списка нет — самый универсальный вариант
+    models = []
+    default = getattr(provider, "default_model", None)
+    if isinstance(default, str) and default:
+        models.append(default)
+    listed = getattr(provider, "models", [])
+    if isinstance(listed, list):
+        models.extend(m for m in listed if isinstance(m, str) and m and m not in models)
+    return models[:limit] or ["gpt-3.5-turbo"]
+
+
+def pick_model(provider):
+    models = getattr(provider, "models", [])
+    if models and isinstance(models, list):
+        return models[0]
+    return candidate_models(provider)[0]
+
+
+def is_valid_answer(response):
+    # Просили одно слово: ответ должен быть коротким и без HTML-мусора
+    return bool(response) and len(response) < 300 and "<!DOCTYPE" not in response
+
+
+# === Фоновый пробник провайдеров
+# Раз в interval секунд дешёвым промптом проверяет текущий пул, стартовый список
+# и очередную порцию каталога g4f (scan_batch штук по кругу). Результаты — в таблицу
+# provider_probes. Провайдер, проваливший max_failures проб подряд, сразу уходит из
+# registry.providers; ожившие и новые рабочие — попадают туда без рестарта.
+class ProviderProber:
+    def __init__(self, registry, store, seed, probe, interval=120, scan_batch=20,
+                 concurrency=5, timeout=20, max_failures=2, min_pool=2, max_pool=8):
+        self.registry = registry
+        self.store = store
+        self.seed = list(seed)
+        self.probe = probe
+        self.interval = interval
+        self.scan_batch = scan_batch
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.min_pool = min_pool
+        self.max_pool = max_pool
+        self.health = {}
+        self._catalog = []
+        self._cursor = 0
+        self._load()
+
+    # Последняя проба каждого провайдера за сутки — чтобы после рестарта не начинать с нуля
+    def _load(self):
+        rows = self.store.query(
+            "SELECT provider, ok, latency, ts FROM provider_probes p WHERE ts = "
+            "(SELECT MAX(ts) FROM provider_probes WHERE provider = p.provider) AND ts > ?",
+            (time.time() - 24 * 3600,)
+        )
+        for name, ok, latency, ts in rows:
+            provider = provider_by_name(name)
+            if provider is not None:
+                self.health[name] = {
+                    'provider': provider, 'ok': bool(ok), 'seen_ok': bool(ok), 'latency': latency,
+                    'failures': 0 if ok else self.max_failures, 'ts': ts,
+                }
+        if self.health:
+            self._rebuild()
+
+    def _next_batch(self):
+        if self._cursor >= len(self._catalog):
+            self._catalog = all_providers()
+            self._cursor = 0
+        batch = self._catalog[self._cursor:self._cursor + self.scan_batch]
+        self._cursor += self.scan_batch
+        return batch
+
+    async def _probe_one(self, provider, semaphore):
+        model = pick_model(provider)
+        async with semaphore:
+            started = time.monotonic()
+            answer = error = None
+            try:
+                answer = (await self.probe(provider, model, PROBE_PROMPT, timeout=self.timeout) or "").strip()
+            except SyncPoolBusy:
+                # потоки проверок заняты зависшими провайдерами — это не вина этого, проверим в следующий раз
+                return
+            except Exception as e:
+                error = str(e)[:200] or type(e).__name__
+        latency = time.monotonic() - started
+        ok = error is None and is_valid_answer(answer)
+        if error is None and not ok:
+            error = 'invalid answer'
+
+        name = provider.__name__
+        state = self.health.get(name)
+        if state is None:
+            state = self.health[name] = {'provider': provider, 'failures': 0, 'seen_ok': False}
+        state.update(ok=ok, latency=latency, ts=time.time())
+        state['failures'] = 0 if ok else state['failures'] + 1
+        state['seen_ok'] = state['seen_ok'] or ok
+        self.store.insert(
+            'provider_probes', ts=state['ts'], provider=name, model=model, ok=int(ok),
+            latency=latency, answer=answer[:100] if answer else None, error=error
+        )
+
+    def _rebuild(self):
+        # одна случайная неудача ещё не приговор — но только для тех, кто уже отвечал
+        alive = [s for s in self.health.values() if s['seen_ok'] and s['failures'] < self.max_failures]
+        alive.sort(key=lambda s: (self.registry.score(s['provider'].__name__), -s['latency']), reverse=True)
+        pool = [s['provider'] for s in alive[:self.max_pool]]
+
+        # Живых слишком мало — лучше оставить прежних, чем остаться вовсе без провайдеров
+        for provider in self.registry.providers + self.seed:
+            if len(pool) >= self.min_pool:
+                break
+            if provider not in pool:
+                pool.append(provider)
+
+        # порядок не важен — registry.ranked() всё равно сортирует по своей статистике
+        old = {p.__name__ for p in self.registry.providers}
+        new = {p.__name__ for p in pool}
+        if new != old:
+            self.registry.providers = pool
+            print(f"[PROBE] Пул провайдеров: +{sorted(new - old)} -{sorted(old - new)} → {len(pool)}")
+
+    async def run_once(self):
+        targets = list(dict.fromkeys(self.registry.providers + self.seed + self._next_batch()))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._probe_one(p, semaphore) for p in targets))
+        self._rebuild()
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[!] Ошибка пробника провайдеров: {e}")
+            await asyncio.sleep(self.interval)
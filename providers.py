@@ -0,0 +1,83 @@
+import random
+
+
+# === Статистика провайдера (всё — экспоненциальные скользящие средние)
+class ProviderStats:
+    def __init__(self, latency=10.0, success=1.0, invalid=0.0, agreement=1.0, calls=0):
+        # новички стартуют с оптимистичными оценками, чтобы их вообще попробовали
+        self.latency = latency
+        self.success = success
+        self.invalid = invalid
+        self.agreement = agreement
+        self.calls = calls
+
+    def to_dict(self):
+        return {
+            'latency': self.latency,
+            'success': self.success,
+            'invalid': self.invalid,
+            'agreement': self.agreement,
+            'calls': self.calls,
+        }
+
+
+# === Реестр провайдеров: ранжирование по латентности, успешности и согласию с итогом
+# Статистика хранится в таблице provider_stats; save() сбрасывает туда изменённые записи.
+class ProviderRegistry:
+    def __init__(self, providers, store, alpha=0.2, explore=0.1):
+        self.providers = list(providers)
+        self.store = store
+        self.alpha = alpha
+        self.explore = explore
+        self.stats = {}
+        self._dirty = set()
+        self._load()
+
+    def _load(self):
+        for name, values in self.store.load_json('provider_stats', 'name').items():
+            try:
+                self.stats[name] = ProviderStats(**values)
+            except TypeError as e:
+                print(f"[!] Статистика провайдера {name} повреждена, начинаю заново: {e}")
+
+    def save(self):
+        for name in self._dirty:
+            self.store.put_json('provider_stats', 'name', name, self.stats[name].to_dict())
+        self._dirty.clear()
+
+    def get(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ProviderStats()
+        return stats
+
+    def _ewma(self, old, value):
+        return old + self.alpha * (value - old)
+
+    def score(self, name):
+        s = self.get(name)
+        return s.success * (1.0 - s.invalid) * (0.5 + 0.5 * s.agreement) / (1.0 + s.latency / 10.0)
+
+    # Порядок вызова: лучшие по очкам, иногда один случайный из хвоста выдвигается вперёд,
+    # чтобы статистика отстающих не застывала навсегда
+    def ranked(self, k):
+        ordered = sorted(self.providers, key=lambda p: self.score(p.__name__), reverse=True)
+        if len(ordered) > k and random.random() < self.explore:
+            pick = random.randrange(k, len(ordered))
+            ordered.insert(k - 1, ordered.pop(pick))
+        return ordered
+
+    # outcome: 'ok' — валидный вердикт, 'invalid' — пустой/странный ответ, 'error' — ошибка или таймаут
+    def record(self, name, latency, outcome):
+        s = self.get(name)
+        s.calls += 1
+        s.latency = self._ewma(s.latency, latency)
+        s.success = self._ewma(s.success, 0.0 if outcome == 'error' else 1.0)
+        if outcome != 'error':
+            s.invalid = self._ewma(s.invalid, 1.0 if outcome == 'invalid' else 0.0)
+        self._dirty.add(name)
+
+    def record_agreement(self, name, agreed):
+        s = self.get(name)
+        s.agreement = self._ewma(s.agreement, 1.0 if agreed else 0.0)
+        self._dirty.add(name)
@@ -0,0 +1,79 @@
+import json
+import time
+
+
+def media_descriptor(media):
+    if media is None:
+        return None
+    photo = getattr(media, 'photo', None)
+    if photo is not None:
+        return {'type': 'photo', 'id': photo.id}
+    document = getattr(media, 'document', None)
+    if document is not None:
+        return {'type': 'document', 'id': document.id, 'mime': getattr(document, 'mime_type', None)}
+    return {'type': type(media).__name__}
+
+
+def serialize_event(event, t):
+    message = event.message
+    chat = event.chat
+    fwd_from = message.fwd_from
+    return {
+        't': round(t, 4),
+        'chat_id': event.chat_id,
+        'chat': {
+            'id': getattr(chat, 'id', None),
+            'title': getattr(chat, 'title', None),
+            'username': getattr(chat, 'username', None),
+            'broadcast': bool(getattr(chat, 'broadcast', False)),
+        } if chat is not None else None,
+        'is_channel': bool(event.is_channel),
+        'id': message.id,
+        'grouped_id': message.grouped_id,
+        'fwd_channel_id': getattr(fwd_from.from_id, 'channel_id', None) if fwd_from and fwd_from.from_id else None,
+        'text': message.text or "",
+        'media': media_descriptor(message.media),
+        'poll': bool(event.poll),
+        'voice': bool(event.voice),
+        'video_note': bool(event.video_note),
+    }
+
+
+# === Запись входящих событий в JSONL (одна строка — одно событие)
+# t — секунды от начала записи, по ним реплеер восстанавливает темп.
+class EventRecorder:
+    def __init__(self, path, flush_every=20):
+        self.path = path
+        self.flush_every = flush_every
+        self.started = time.monotonic()
+        self.count = 0
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, event):
+        try:
+            line = json.dumps(serialize_event(event, time.monotonic() - self.started), ensure_ascii=False)
+        except Exception as e:
+            print(f"[!] Не удалось записать событие: {e}")
+            return
+        self._file.write(line + "\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        self._file.flush()
+        self._file.close()
+
+
+def load_recording(path):
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                print(f"[!] {path}:{line_no}: битая строка, пропускаю")
+    return records
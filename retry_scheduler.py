@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+
+
+# === Очередь отложенных классификаций
+# Хранится в таблице retry_queue, поэтому переживает рестарт. Пока провайдеры лежат,
+# в памяти нет ни одной висящей корутины — только записи с временем next_at.
+class RetryScheduler:
+    def __init__(self, store, base_delay=60, max_delay=1800,
+                 max_attempts=12, batch_size=10, poll_interval=60):
+        self.store = store
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.entries = {}
+        self._wakeup = asyncio.Event()
+        self._load()
+
+    def _load(self):
+        self.entries = self.store.load_json('retry_queue', 'key')
+        if self.entries:
+            print(f"[SYSTEM] Восстановлено отложенных постов: {len(self.entries)}")
+
+    def _save(self, entry):
+        self.store.put_json('retry_queue', 'key', entry['key'], entry)
+
+    def _remove(self, entry):
+        del self.entries[entry['key']]
+        self.store.delete('retry_queue', 'key', entry['key'])
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempts)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def schedule(self, chat_id, message_ids, text, fingerprint):
+        key = f"{chat_id}:{min(message_ids)}"
+        if key in self.entries:
+            return
+        self.entries[key] = {
+            'key': key,
+            'chat_id': chat_id,
+            'message_ids': list(message_ids),
+            'text': text,
+            'fingerprint': fingerprint,
+            'attempts': 0,
+            'created_at': time.time(),
+            'next_at': time.time() + self._backoff(0),
+        }
+        self._save(self.entries[key])
+        self._wakeup.set()
+
+    def _fail(self, entry, now):
+        entry['attempts'] += 1
+        if entry['attempts'] >= self.max_attempts:
+            self._remove(entry)
+            print(f"[!] Пост {entry['key']} снят с повторов после {entry['attempts']} попыток")
+        else:
+            entry['next_at'] = now + self._backoff(entry['attempts'])
+            self._save(entry)
+
+    async def _try(self, entry, attempt):
+        try:
+            return await attempt(entry)
+        except Exception as e:
+            print(f"[!] Ошибка повтора {entry['key']}: {e}")
+            return False
+
+    async def _drain(self, entries, attempt):
+        for i in range(0, len(entries), self.batch_size):
+            batch = entries[i:i + self.batch_size]
+            results = await asyncio.gather(*(self._try(entry, attempt) for entry in batch))
+            now = time.time()
+            for entry, ok in zip(batch, results):
+                if entry['key'] not in self.entries:
+                    continue
+                if ok:
+                    self._remove(entry)
+                else:
+                    self._fail(entry, now)
+
+    async def run(self, attempt):
+        while True:
+            now = time.time()
+            due = sorted((e for e in self.entries.values() if e['next_at'] <= now), key=lambda e: e['next_at'])
+
+            if not due:
+                next_at = min((e['next_at'] for e in self.entries.values()), default=now + self.poll_interval)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(1.0, min(next_at - now, self.poll_interval)))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Сначала одна проба: если провайдеры всё ещё лежат, остальные не трогаем
+            probe = due[0]
+            if await self._try(probe, attempt):
+                self._remove(probe)
+                # провайдеры ожили — разгребаем всё, что накопилось, пачками
+                rest = list(self.entries.values())
+                if rest:
+                    print(f"[SYSTEM] Провайдеры доступны, разбираю очередь повторов: {len(rest)}")
+                    await self._drain(rest, attempt)
+            else:
+                for entry in due:
+                    if entry['key'] in self.entries:
+                        self._fail(entry, now)
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from collections import deque
+
+from telethon.errors import FloodWaitError
+
+PRIORITY_DELIVERY = 0
+PRIORITY_DIAGNOSTICS = 1
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _fill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Сколько ждать, пока хватит на cost (альбом дороже одиночного сообщения)
+    def wait_time(self, cost, now):
+        self._fill(now)
+        need = min(cost, self.burst) - self.tokens
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self, cost, now):
+        self._fill(now)
+        self.tokens -= cost
+
+
+class SendRequest:
+    def __init__(self, destination, factory, priority, cost, max_attempts, label):
+        self.destination = destination
+        self.factory = factory
+        self.priority = priority
+        self.cost = cost
+        self.max_attempts = max_attempts
+        self.label = label
+        self.attempts = 0
+        self.not_before = 0.0
+        self.future = asyncio.get_running_loop().create_future()
+
+
+# === Планировщик исходящих отправок
+# Все вызовы Telegram на отправку идут через send(): общий token bucket и по одному
+# на каждый канал назначения. Доставки постов идут раньше диагностики. FloodWait
+# на любой отправке останавливает все отправки на указанное время, сама отправка
+# возвращается в начало очереди. Прочие ошибки — повтор с экспоненциальной
+# паузой, пока не кончатся попытки; тогда исключение получает вызывающий.
+class SendScheduler:
+    def __init__(self, rate=1.0, burst=5, destination_rate=0.33, destination_burst=3,
+                 concurrency=2, max_attempts=5, base_delay=5, max_delay=300):
+        self.bucket = TokenBucket(rate, burst)
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {}
+        self.queues = {PRIORITY_DELIVERY: deque(), PRIORITY_DIAGNOSTICS: deque()}
+        self.blocked_until = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._tasks = set()
+
+    def pending(self):
+        return sum(len(q) for q in self.queues.values())
+
+    async def send(self, destination, factory, priority=PRIORITY_DELIVERY, cost=1, max_attempts=None, label=""):
+        request = SendRequest(destination, factory, priority, cost, max_attempts or self.max_attempts, label)
+        self.queues[priority].append(request)
+        self._wakeup.set()
+        return await request.future
+
+    def _destination_bucket(self, destination):
+        bucket = self.buckets.get(destination)
+        if bucket is None:
+            bucket = self.buckets[destination] = TokenBucket(self.destination_rate, self.destination_burst)
+        return bucket
+
+    # Следующая отправка, которую можно делать прямо сейчас, или (None, сколько ждать)
+    def _pick(self, now):
+        if now < self.blocked_until:
+            return None, self.blocked_until - now
+        best_wait = None
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            for request in list(queue):
+                if request.future.done():
+                    # вызывающий уже не ждёт (остановка конвейера)
+                    queue.remove(request)
+                    continue
+                bucket = self._destination_bucket(request.destination)
+                wait = max(
+                    request.not_before - now,
+                    self.bucket.wait_time(request.cost, now),
+                    bucket.wait_time(request.cost, now),
+                )
+                if wait <= 0:
+                    queue.remove(request)
+                    self.bucket.take(request.cost, now)
+                    bucket.take(request.cost, now)
+                    return request, 0.0
+                best_wait = wait if best_wait is None else min(best_wait, wait)
+        return None, best_wait
+
+    def _backoff(self, attempts):
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    async def _send(self, request):
+        try:
+            result = await request.factory()
+        except asyncio.CancelledError:
+            request.future.cancel()
+            raise
+        except FloodWaitError as e:
+            self.flood_waits += 1
+            self.flood_wait_seconds += e.seconds
+            self.blocked_until = max(self.blocked_until, time.monotonic() + e.seconds + 1)
+            # FloodWait — не вина отправки: попытку не засчитываем, встаёт первой в очередь
+            self.queues[request.priority].appendleft(request)
+            print(f"[FLOOD] FloodWait {e.seconds}s ({request.label}), отправки на паузе, в очереди: {self.pending()}")
+        except Exception as e:
+            request.attempts += 1
+            if request.attempts >= request.max_attempts:
+                self.failed += 1
+                if not request.future.done():
+                    request.future.set_exception(e)
+            else:
+                self.retries += 1
+                request.not_before = time.monotonic() + self._backoff(request.attempts)
+                self.queues[request.priority].append(request)
+                print(f"[!] Ошибка отправки ({request.label}): {e} — повтор {request.attempts}/{request.max_attempts - 1}")
+        else:
+            self.sent += 1
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+    # Ждёт, пока какую-нибудь отправку можно делать прямо сейчас
+    async def _next(self):
+        while True:
+            request, wait = self._pick(time.monotonic())
+            if request is not None:
+                return request
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        try:
+            while True:
+                # сначала слот, потом выбор: пока ждём слот, соседняя отправка может
+                # поймать FloodWait, и выбранная заранее ушла бы посреди паузы
+                await self._slots.acquire()
+                try:
+                    request = await self._next()
+                except BaseException:
+                    self._slots.release()
+                    raise
+                task = asyncio.create_task(self._send(request))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            for queue in self.queues.values():
+                for request in queue:
+                    request.future.cancel()
+                queue.clear()
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "blocked_for": max(0.0, self.blocked_until - time.monotonic()),
+        }
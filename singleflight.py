@@ -0,0 +1,46 @@
+import asyncio
+
+
+# === Один запрос на ключ
+# Пока по ключу идёт работа, повторные do() не запускают свою, а ждут ту же задачу
+# и получают её результат или её исключение. Отмена одного ожидающего задачу не
+# трогает; задача отменяется, только если ждать её не осталось никого.
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _finished(self, key, task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+        # чтобы ошибка, которую уже некому отдать, не шумела в логе
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, factory):
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(factory())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if call[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            call[1] -= 1
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": self.in_flight()}
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    ts REAL NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    grouped_id INTEGER,
+    content_hash TEXT,
+    parts INTEGER NOT NULL,
+    text_len INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_chat_msg ON posts (chat_id, message_id);
+CREATE INDEX IF NOT EXISTS posts_hash ON posts (content_hash);
+CREATE INDEX IF NOT EXISTS posts_ts ON posts (ts);
+
+CREATE TABLE IF NOT EXISTS verdicts (
+    ts REAL NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    content_hash TEXT,
+    verdict TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS verdicts_chat_msg ON verdicts (chat_id, message_id);
+CREATE INDEX IF NOT EXISTS verdicts_hash ON verdicts (content_hash);
+CREATE INDEX IF NOT EXISTS verdicts_ts ON verdicts (ts);
+
+CREATE TABLE IF NOT EXISTS provider_results (
+    ts REAL NOT NULL,
+    content_hash TEXT,
+    provider TEXT NOT NULL,
+    model TEXT,
+    outcome TEXT NOT NULL,
+    answer TEXT,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS provider_results_hash ON provider_results (content_hash);
+CREATE INDEX IF NOT EXISTS provider_results_ts ON provider_results (ts);
+
+CREATE TABLE IF NOT EXISTS deliveries (
+    ts REAL NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS deliveries_chat_msg ON deliveries (chat_id, message_id);
+CREATE INDEX IF NOT EXISTS deliveries_ts ON deliveries (ts);
+
+CREATE TABLE IF NOT EXISTS provider_probes (
+    ts REAL NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT,
+    ok INTEGER NOT NULL,
+    latency REAL,
+    answer TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS provider_probes_provider_ts ON provider_probes (provider, ts);
+
+CREATE TABLE IF NOT EXISTS classifier_counts (
+    label TEXT NOT NULL,
+    token TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (label, token)
+);
+
+CREATE TABLE IF NOT EXISTS verdict_cache (
+    fingerprint TEXT PRIMARY KEY,
+    verdict TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS retry_queue (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS provider_stats (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channel_entities (
+    channel_id INTEGER PRIMARY KEY,
+    username TEXT,
+    title TEXT,
+    ok INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+"""
+
+
+# === Хранилище состояния (SQLite в режиме WAL)
+# Чтение — только при старте. Запись из обработчиков — execute(), который лишь
+# кладёт запрос в буфер; отдельная задача раз в flush_interval пишет пачку
+# одной транзакцией в своём потоке, так что цикл событий диск не ждёт.
+class Store:
+    def __init__(self, path='bot.db', flush_interval=1.0, max_batch=1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-writer')
+        self.written = 0
+
+    # --- запись (не блокирует)
+    def execute(self, sql, params=()):
+        self._pending.append((sql, params))
+
+    def insert(self, table, **row):
+        columns = ', '.join(row)
+        marks = ', '.join('?' for _ in row)
+        self.execute(f"INSERT INTO {table} ({columns}) VALUES ({marks})", tuple(row.values()))
+
+    def put_json(self, table, key_column, key, data):
+        self.execute(
+            f"INSERT OR REPLACE INTO {table} ({key_column}, data) VALUES (?, ?)",
+            (key, json.dumps(data, ensure_ascii=False))
+        )
+
+    def delete(self, table, key_column, key):
+        self.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (key,))
+
+    def _write(self, batch):
+        with self.conn:
+            for sql, params in batch:
+                self.conn.execute(sql, params)
+        self.written += len(batch)
+
+    def _take_batch(self):
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            while self._pending:
+                batch = self._take_batch()
+                try:
+                    await loop.run_in_executor(self._executor, self._write, batch)
+                except sqlite3.Error as e:
+                    print(f"[!] Ошибка записи в {self.path}: {e} (потеряно {len(batch)} записей)")
+
+    # сначала дожидаемся пачки, которую пишет поток, потом дописываем хвост сами
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while self._pending:
+            self._write(self._take_batch())
+        self.conn.close()
+
+    def pending(self):
+        return len(self._pending)
+
+    # --- чтение (только при старте)
+    def load_json(self, table, key_column):
+        rows = self.conn.execute(f"SELECT {key_column}, data FROM {table}").fetchall()
+        result = {}
+        for key, data in rows:
+            try:
+                result[key] = json.loads(data)
+            except ValueError:
+                print(f"[!] Битая запись {table}.{key}, пропускаю")
+        return result
+
+    def query(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
@@ -1,13 +1,23 @@
-import g4f
+import argparse
 import asyncio
+import json
+import os
 import sys
+import time
 from g4f.client import AsyncClient
+from prober import PROBE_PROMPT, all_providers, candidate_models, is_valid_answer
 
 # --- НАСТРОЙКИ ---
 CONCURRENT_LIMIT = 15       # Количество потоков
-TEST_PROMPT = "Answer with one word: is a tomato red or purple?"
+TEST_PROMPT = PROBE_PROMPT  # тот же промпт, что у фонового пробника в bot.py
 OUTPUT_FILE = "good_chat_providers.txt"
+RESULTS_FILE = "good_chat_providers.jsonl"  # Поток результатов: одна JSON-строка на проверку
+CACHE_FILE = "provider_scan_cache.json"     # Прошлые результаты по каждой паре провайдер+модель
+MODELS_PER_PROVIDER = 3     # Сколько моделей проверять у одного провайдера
 REQUEST_TIMEOUT = 25        # Таймаут чуть побольше для медленных
+MIN_TIMEOUT = 5             # Нижняя граница адаптивного таймаута
+OK_TTL = 6 * 3600           # Рабочие перепроверяем раз в 6 часов
+FAIL_TTL = 3600             # Нерабочие — раз в час (чаще они всё равно не оживают)
 # --- КОНЕЦ НАСТРОЕК ---
 
 # Настройка кодировки
@@ -17,122 +27,160 @@ if sys.stdout.encoding != 'utf-8':
 # Инициализируем клиент
 client = AsyncClient()
 
-async def test_provider(provider_cls, model_to_use: str):
-    provider_name = provider_cls.__name__
+
+# === Кэш сканирования: ключ "провайдер:модель"
+def load_cache():
     try:
-        # Пытаемся отправить запрос
-        response = await client.chat.completions.create(
-            model=model_to_use,
-            messages=[{"role": "user", "content": TEST_PROMPT}],
-            provider=provider_cls,
-        )
-        
-        if response and response.choices:
-            content = response.choices[0].message.content
-            if content:
-                # Очистка от лишних пробелов
-                return provider_name, content.strip()
-        return provider_name, None
-
-    except Exception:
-        # Любая ошибка (сеть, не тот тип провайдера, бан) = провал
-        return provider_name, None
-
-async def worker(provider, semaphore, file_handle, counters):
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        print(f"[!] {CACHE_FILE} повреждён, сканирую заново")
+        return {}
+
+
+def save_cache(cache):
+    tmp = CACHE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, CACHE_FILE)
+
+
+def is_stale(entry, now):
+    if entry is None:
+        return True
+    return now - entry['ts'] >= (OK_TTL if entry['ok'] else FAIL_TTL)
+
+
+# Рабочим — запас в три прошлых задержки, вечно висящим — всё меньше времени на каждую попытку
+def adaptive_timeout(entry):
+    if entry is None:
+        return REQUEST_TIMEOUT
+    if entry['ok']:
+        return max(MIN_TIMEOUT, min(REQUEST_TIMEOUT, entry['latency'] * 3 + 2))
+    if entry.get('error') == 'timeout':
+        return max(MIN_TIMEOUT, REQUEST_TIMEOUT / 2 ** entry.get('failures', 1))
+    return REQUEST_TIMEOUT
+
+
+async def test_provider(provider_cls, model_to_use: str):
+    # Пытаемся отправить запрос
+    response = await client.chat.completions.create(
+        model=model_to_use,
+        messages=[{"role": "user", "content": TEST_PROMPT}],
+        provider=provider_cls,
+    )
+    if response and response.choices:
+        content = response.choices[0].message.content
+        if content:
+            # Очистка от лишних пробелов
+            return content.strip()
+    return None
+
+
+async def worker(provider, model_to_use, semaphore, cache, results, counters):
+    key = f"{provider.__name__}:{model_to_use}"
+    previous = cache.get(key)
+    timeout = adaptive_timeout(previous)
+
     async with semaphore:
-        # --- ЛОГИКА ВЫБОРА МОДЕЛИ ---
-        # Мы пытаемся угадать модель. Если у провайдера есть список - берем первую.
-        # Если нет - пробуем самые популярные стандарты, которые поддерживают почти все.
-        model_list = getattr(provider, "models", [])
-        
-        if model_list and isinstance(model_list, list) and len(model_list) > 0:
-            model_to_use = model_list[0]
-        else:
-            model_to_use = "gpt-3.5-turbo" # Самый универсальный вариант
-
-        # --- ТЕСТ ---
-        provider_name = provider.__name__
-        response = None
-        
+        started = time.monotonic()
+        response = error = None
         try:
             # Жесткий таймаут снаружи, чтобы не зависать на "мертвых" провайдерах
-            provider_name, response = await asyncio.wait_for(
-                test_provider(provider, model_to_use), 
-                timeout=REQUEST_TIMEOUT
+            response = await asyncio.wait_for(test_provider(provider, model_to_use), timeout=timeout)
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except Exception as e:
+            # Любая ошибка (сеть, не тот тип провайдера, бан) = провал
+            error = str(e)[:200] or type(e).__name__
+        latency = time.monotonic() - started
+
+    ok = error is None and is_valid_answer(response)
+    if error is None and not ok:
+        error = "invalid answer"
+
+    entry = {
+        'provider': provider.__name__,
+        'model': model_to_use,
+        'ok': ok,
+        'latency': round(latency, 3),
+        'timeout': timeout,
+        'ts': time.time(),
+        'answer': response[:100] if response else None,
+        'error': error,
+        'failures': 0 if ok else (previous or {}).get('failures', 0) + 1,
+    }
+    cache[key] = entry
+    results.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    results.flush()
+
+    counters['completed'] += 1
+    if ok:
+        counters['successful'] += 1
+        print(f"{' ' * 100}\r", end="")
+        print(f"[+] НАЙДЕН: {provider.__name__:<25} | {model_to_use:<25} | {latency:.1f}s | Ответ: {response[:40]}")
+
+    # Обновление прогресса
+    print(f"Обработано: {counters['completed']}/{counters['total']} | Найдено рабочих: {counters['successful']}", end='\r', flush=True)
+
+
+def write_summary(cache):
+    good = sorted((e for e in cache.values() if e['ok']), key=lambda e: e['latency'])
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        f.write("--- SCAN RESULT ---\n\n")
+        for e in good:
+            f.write(
+                f"Provider: {e['provider']}\n"
+                f"Model: {e['model']}\n"
+                f"Latency: {e['latency']:.1f}s\n"
+                f"Response: {e['answer']}\n"
+                f"{'-'*30}\n"
             )
-        except Exception:
-            # Игнорируем ошибки таймаута и прочие
-            pass
-
-        counters['completed'] += 1
-
-        # --- ПРОВЕРКА РЕЗУЛЬТАТА ---
-        if response:
-            # Простейшая проверка: ответ должен быть коротким (так как мы просили одно слово)
-            # и не содержать явного HTML мусора
-            if len(response) < 300 and "<!DOCTYPE" not in response:
-                counters['successful'] += 1
-                
-                # Запись в файл
-                result_str = (
-                    f"Provider: {provider_name}\n"
-                    f"Model: {model_to_use}\n"
-                    f"Response: {response}\n"
-                    f"{'-'*30}\n"
-                )
-                file_handle.write(result_str)
-                file_handle.flush()
-                
-                # Вывод в консоль (зеленым цветом, если поддерживает терминал, или просто текстом)
-                print(f"{' ' * 100}\r", end="")
-                print(f"[+] НАЙДЕН: {provider_name:<25} | Ответ: {response[:40]}")
-
-        # Обновление прогресса
-        print(f"Обработано: {counters['completed']}/{counters['total']} | Найдено рабочих: {counters['successful']}", end='\r', flush=True)
-
-async def main():
-    # 1. Получаем ВСЕХ провайдеров без разбора
-    if hasattr(g4f.Provider, '__providers__'):
-         all_raw_providers = g4f.Provider.__providers__
-    else:
-         all_raw_providers = list(g4f.Provider.__map__.values())
-
-    providers_to_test = []
-    
-    # Исключаем только технические базовые классы, которые нельзя запустить
-    technical_classes = ["BaseProvider", "AsyncProvider", "AsyncGeneratorProvider", "ProviderUtils"]
-
-    for p in all_raw_providers:
-        if p and p.__name__ not in technical_classes:
-            providers_to_test.append(p)
-
-    # Удаляем дубликаты
-    providers_to_test = list(set(providers_to_test))
-    total = len(providers_to_test)
-
-    print(f"Всего загружено провайдеров из g4f: {total}")
-    print("Запускаю режим полной проверки (без фильтров).")
+    return good
+
+
+async def main(full=False):
+    cache = {} if full else load_cache()
+    now = time.time()
+
+    # 1. Все провайдеры из g4f (кроме технических базовых классов), по несколько моделей у каждого
+    pairs = [(p, model) for p in all_providers() for model in candidate_models(p, MODELS_PER_PROVIDER)]
+    to_scan = [(p, model) for p, model in pairs if is_stale(cache.get(f"{p.__name__}:{model}"), now)]
+    total = len(to_scan)
+
+    print(f"Пар провайдер+модель: {len(pairs)} | из кэша: {len(pairs) - total} | проверяю: {total}")
     print("В консоли могут появляться ошибки от нетекстовых провайдеров - это нормально.")
     print("-" * 50)
 
     semaphore = asyncio.Semaphore(CONCURRENT_LIMIT)
     counters = {'completed': 0, 'successful': 0, 'total': total}
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write(f"--- FULL SCAN RESULT ---\n\n")
-        tasks = [worker(p, semaphore, f, counters) for p in providers_to_test]
-        await asyncio.gather(*tasks)
+    try:
+        with open(RESULTS_FILE, "a", encoding="utf-8") as results:
+            tasks = [worker(p, model, semaphore, cache, results, counters) for p, model in to_scan]
+            await asyncio.gather(*tasks)
+    finally:
+        # даже при Ctrl+C сохраняем то, что успели проверить
+        save_cache(cache)
+
+    good = write_summary(cache)
 
     print("\n\n" + "="*50)
-    print(f"Готово. Рабочих провайдеров: {counters['successful']}")
-    print(f"Результат сохранен в: {OUTPUT_FILE}")
+    print(f"Готово. Рабочих пар провайдер+модель: {len(good)} (новых проверок: {counters['completed']})")
+    print(f"Результат сохранен в: {OUTPUT_FILE}, поток проверок — в {RESULTS_FILE}")
     print("="*50)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сканер g4f-провайдеров с кэшем результатов")
+    parser.add_argument("--full", action="store_true", help="игнорировать кэш и проверить всё заново")
+    args = parser.parse_args()
+
     if sys.platform == "win32":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    
+
     try:
-        asyncio.run(main())
+        asyncio.run(main(full=args.full))
     except KeyboardInterrupt:
         print("\nОстановлено пользователем.")
@@ -0,0 +1,73 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+
+def content_fingerprint(clean_text, media_signatures=()):
+    text = re.sub(r'\s+', ' ', clean_text).strip().lower()
+    h = hashlib.sha256(text.encode('utf-8'))
+    for sig in sorted(s for s in media_signatures if s):
+        h.update(b'\0' + sig.encode('utf-8'))
+    return h.hexdigest()
+
+
+# === Кэш вердиктов по отпечатку контента
+# LRU с TTL: старые записи вытесняются по размеру, протухшие — по времени.
+# Живёт в памяти, изменения пишутся в таблицу verdict_cache общего хранилища.
+class VerdictCache:
+    def __init__(self, store, ttl=7 * 24 * 3600, max_entries=20000):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._load()
+
+    def _load(self):
+        rows = self.store.query(
+            "SELECT fingerprint, verdict, ts FROM verdict_cache WHERE ts > ? ORDER BY ts",
+            (time.time() - self.ttl,)
+        )
+        for fingerprint, verdict, ts in rows:
+            self._entries[fingerprint] = (verdict, ts)
+        self.store.execute("DELETE FROM verdict_cache WHERE ts <= ?", (time.time() - self.ttl,))
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            fingerprint, _ = self._entries.popitem(last=False)
+            self.store.delete('verdict_cache', 'fingerprint', fingerprint)
+
+    def get(self, fingerprint):
+        entry = self._entries.get(fingerprint)
+        if entry is not None and time.time() - entry[1] >= self.ttl:
+            del self._entries[fingerprint]
+            self.store.delete('verdict_cache', 'fingerprint', fingerprint)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(fingerprint)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, fingerprint, verdict):
+        ts = time.time()
+        self._entries[fingerprint] = (verdict, ts)
+        self._entries.move_to_end(fingerprint)
+        self.store.execute(
+            "INSERT OR REPLACE INTO verdict_cache (fingerprint, verdict, ts) VALUES (?, ?, ?)",
+            (fingerprint, verdict, ts)
+        )
+        self._evict()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,89 @@
+import asyncio
+
+VERDICTS = ('полезно', 'реклама', 'бесполезно')
+
+
+def empty_summary():
+    return {verdict: 0 for verdict in VERDICTS}
+
+
+# Правило то же, что и раньше: оставляем, только если 'полезно' больше остальных вместе
+def decide(summary):
+    if summary["полезно"] > (summary["реклама"] + summary["бесполезно"]):
+        return "полезно"
+    return "мусор"
+
+
+# Исход уже не изменится, даже если все оставшиеся ответят одинаково
+def is_settled(summary, remaining):
+    good = summary["полезно"]
+    bad = summary["реклама"] + summary["бесполезно"]
+    if good + bad == 0:
+        return False
+    return good > bad + remaining or good + remaining <= bad
+
+
+def _disagree(summary):
+    return summary["полезно"] and (summary["реклама"] + summary["бесполезно"])
+
+
+# === Голосование с ранним выходом и хеджированием
+# calls и reserve: [(имя, фабрика корутины)], корутина возвращает вердикт или None.
+# Из reserve добавляется ещё один провайдер, если за hedge_delay никто не ответил,
+# если ответы расходятся или если запущенные кончились, а исход не решён.
+# Возвращает сводку, ответы по провайдерам и имена тех, кого не дождались.
+async def run_vote(calls, reserve=(), hedge_delay=None):
+    summaries, answers, cut_off = await _run_votes(calls, reserve, hedge_delay, 1, lambda result: [result])
+    return summaries[0], answers, cut_off
+
+
+# То же для пакета из count постов: корутина возвращает список вердиктов по постам
+# или None. Выход — когда решён исход каждого поста, хедж — если не решён хоть один.
+async def run_batch_vote(calls, count, reserve=(), hedge_delay=None):
+    return await _run_votes(calls, reserve, hedge_delay, count, lambda result: result or [])
+
+
+async def _run_votes(calls, reserve, hedge_delay, count, verdicts_of):
+    tasks = {}
+    pending = set()
+    reserve = list(reserve)
+    summaries = [empty_summary() for _ in range(count)]
+    answers = {}
+
+    def launch(name, factory):
+        task = asyncio.ensure_future(factory())
+        tasks[task] = name
+        pending.add(task)
+
+    for name, factory in calls:
+        launch(name, factory)
+
+    try:
+        while pending:
+            timeout = hedge_delay if reserve else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch(*reserve.pop(0))
+                continue
+
+            for task in done:
+                pending.discard(task)
+                result = task.result()
+                answers[tasks[task]] = result
+                for summary, verdict in zip(summaries, verdicts_of(result)):
+                    if verdict in summary:
+                        summary[verdict] += 1
+
+            unsettled = [s for s in summaries if not is_settled(s, len(pending))]
+            if not unsettled:
+                break
+
+            if reserve and (any(_disagree(s) for s in unsettled) or not pending):
+                launch(*reserve.pop(0))
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return summaries, answers, [tasks[task] for task in pending]